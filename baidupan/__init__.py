@@ -1,3 +1,4 @@
+import asyncio
 import re
 
 from nonebot import *
@@ -57,62 +58,30 @@ async def pan_main(*params):
 async def get_share(ctx, keyword, pan_url: str,
                     pwd=None, dir_str=None,
                     is_get_url=True,
-                    is_get_ru=None):
+                    is_get_ru=None,
+                    file_msg=None):
+    """
+    file_msg: 批量导入时传入一个列表 不发送进度和单独的文件消息, 文件信息放进这个列表并拼在返回的消息里
+    """
+    quiet = file_msg is not None
     if not pan_url:
         return '文件无法创建下载链接..\n'
 
     tip = f'发送 panhelp 查看使用方法\n'
     file_r = dupan_link.pan_parse(keyword)
-    sp = util.send_process(ctx, 0, 3)
 
     if file_r and keyword:
-        is_local = None
-        msg = ''
-        for info in file_r:
-            is_ok = ru.rapidupload(
-                info.md5,
-                info.md5s,
-                info.size,
-                info.name,
-                dir_name=f'{share.get_dir_str(ctx.user_id)}/',
-            )
-            if not is_ok:
-                msg += f'{info.name} 获取失败啦\n'
-                continue
-            await sp.send(f'秒传文件获取成功 [{info.name}]')
-            # 大于50M 需要分享后处理
-            if int(info.size) > 52428800:
-                await sp.send('正在转存.')
-                s_url, shareid = share.set_share(is_ok['fs_id'])
-                if config.rules.auto_cancel_share:
-                    share.auto_cancel_share(shareid, is_ok['path'])  # 自动取消分享
-                if s_url:
-                    await sp.send()
-                    msg += await get_share(ctx, '', s_url, pwd='erin')
-                    continue
-                else:
-                    await sp.send('尝试创建本地下载地址..')
-                    urls = api.get_local_download_link(is_ok['path'])
-                    if not urls:
-                        msg += f'\n——————————\n文件 {info.name} 获取失败\n——————————\n'
-                        continue
-                    # url = api.get_real_url_by_dlink(urls[0], urls=urls, ua=api.get_pan_ua())
-                    url = urls[0]
-                    is_local = True
-
-            else:
-                url = '\n'.join(api.get_web_file_url([is_ok['fs_id']]))
-
-            if not url:
-                await _bot.send(ctx, f'{info.name} 获取下载地址失败啦\n')
-                continue
-            msg += '——————————\n'
-            msg += f'文件名: {info.name}\n'
-            msg += f'大小: {util.size_format(int(info.size))}\n'
-            msg += f'下载地址: {url}\n'
-            msg += '——————————\n'
+        results = await batch_rapidupload(ctx, file_r)
+        msg = ''.join([x.msg for x in results])
+        is_local = any([x.is_local for x in results])
         return f'{msg}请设置这个UA下载 {api.get_pan_ua()}' if is_local else msg
 
+    sp = None if quiet else util.send_process(ctx, 0, 3)
+
+    async def progress(msg=None):
+        if sp:
+            await sp.send(msg)
+
     surl, s_pwd = share.get_surl(pan_url)
     if not surl:
         return f'链接格式不正确啦\n{tip}'
@@ -125,62 +94,160 @@ async def get_share(ctx, keyword, pan_url: str,
 
     surl = surl[1:]
     # await _bot.send(ctx, f'{sp.send(1, 4)} 网盘分享链接获取成功 [1{surl}]')
-    randsk = share.verify(surl, pwd)
+    randsk = await share.verify(surl, pwd)
     if not randsk:
         return f'啊这 提取码错误或者是文件失效\n{tip}'
-    await sp.send('正在获取分享信息')
-    yun_data = share.get_yun_data(surl, randsk)
+    await progress('正在获取分享信息')
+    yun_data = await share.get_yun_data(surl, randsk)
     if not yun_data:
         return '分享过期或者被取消'
     if yun_data.get('share_uk'):
         yun_data.uk = yun_data.share_uk
-    file_list = share.get_file_list(yun_data.shareid, yun_data.uk, randsk, dir_str=dir_str)
+    file_list = await share.get_file_list(yun_data.shareid, yun_data.uk, randsk, dir_str=dir_str)
 
     if file_list.errno != 0:
         return '文件失效或者分享被取消'
-    await sp.send('正在获取文件信息')
+    await progress('正在获取文件信息')
+
+    msg_dir_str = []
+    file_info = []
+    # 每解析完一批文件就先发出去
+    async for dirs, infos in share.iter_file_info(surl, yun_data, randsk,
+                                                 dir_str=dir_str,
+                                                 recursive=config.rules.get('walk_sub_dir', False),
+                                                 first_page=file_list):
+        msg_dir_str += dirs
+        file_info += infos
+        if is_get_url:
+            for file_i in infos:
+                msg = '文件名: %s\n大小: %s\n地址: %s' % (
+                    file_i['name'], util.size_format(file_i['size']), file_i['url'])
+                if quiet:
+                    file_msg.append(msg)
+                else:
+                    await _bot.send(ctx, msg)
 
-    msg_dir_str, file_info = share.handle_file_list(surl, file_list, yun_data, randsk)
     if not msg_dir_str and not file_info:
         return '获取文件列表失败'
 
-    if is_get_url:
-        for file_i in file_info:
-            await _bot.send(ctx, '文件名: %s\n大小: %s\n地址: %s' % (
-                file_i['name'], util.size_format(file_i['size']), file_i['url']))
-
     if is_get_ru:
         for file_i in file_info:
             if isinstance(yun_data.file_list, list):
-                yun_data.file_list = util.dict_to_object({'list': file_list.list})
-            ru_link = await get_ru(ctx, file_i['url'], yun_data, randsk)
+                yun_data.file_list = util.dict_to_object({'list': file_info})
+            ru_link = await get_ru(ctx, file_i['url'], yun_data, randsk, fs_id=file_i['fs_id'])
             await _bot.send(ctx, ru_link)
-    await sp.send()
+    await progress()
+    if quiet:
+        if not file_msg:
+            return '没有获取到文件'
+        return ''.join(f'——————————\n{x}\n' for x in file_msg) + '——————————\n'
     return f'找到以下目录(在原有的命令后加上{config.comm.split}目录进入)：\n' + '\n'.join(
         msg_dir_str) if msg_dir_str else f'发送 {config.comm.help} 查看下载方法\n使用ru#来获取秒传地址'
 
 
+# 导入一个秒传文件并获取下载地址
+async def import_rapidupload(ctx, info, sp=None):
+    async def progress(msg=None):
+        if sp:
+            await sp.send(msg)
+
+    result = util.Dict(name=info.name, ok=False, is_local=False, msg='')
+    is_ok = await ru.rapidupload(
+        info.md5,
+        info.md5s,
+        info.size,
+        info.name,
+        dir_name=f'{share.get_dir_str(ctx.user_id)}/',
+    )
+    if not is_ok:
+        result.msg = f'{info.name} 获取失败啦\n'
+        return result
+    await progress(f'秒传文件获取成功 [{info.name}]')
+    # 大于50M 需要分享后处理
+    if int(info.size) > 52428800:
+        await progress('正在转存.')
+        s_url, shareid = await share.set_share(is_ok['fs_id'])
+        if config.rules.auto_cancel_share:
+            share.auto_cancel_share(shareid, is_ok['path'])  # 自动取消分享
+        if s_url:
+            if sp:
+                result.ok = True
+                result.msg = await get_share(ctx, '', s_url, pwd='erin')
+                return result
+            # 批量导入的时候不单独发进度 拿到文件信息才算成功
+            file_msg = []
+            result.msg = await get_share(ctx, '', s_url, pwd='erin', file_msg=file_msg)
+            result.ok = bool(file_msg)
+            if not result.ok:
+                result.msg = f'{info.name} {result.msg.strip()}\n'
+            return result
+        await progress('尝试创建本地下载地址..')
+        urls = await api.get_local_download_link(is_ok['path'])
+        if not urls:
+            result.msg = f'\n——————————\n文件 {info.name} 获取失败\n——————————\n'
+            return result
+        # url = api.get_real_url_by_dlink(urls[0], urls=urls, ua=api.get_pan_ua())
+        url = urls[0]
+        result.is_local = True
+    else:
+        url = '\n'.join(await api.get_web_file_url([is_ok['fs_id']]))
+
+    if not url:
+        result.msg = f'{info.name} 获取下载地址失败啦\n'
+        return result
+    result.ok = True
+    result.msg = '——————————\n'
+    result.msg += f'文件名: {info.name}\n'
+    result.msg += f'大小: {util.size_format(int(info.size))}\n'
+    result.msg += f'下载地址: {url}\n'
+    result.msg += '——————————\n'
+    return result
+
+
+# 批量导入秒传文件 同时导入 rapidupload_concurrency 个, 进度只保留一条消息
+async def batch_rapidupload(ctx, file_r):
+    if len(file_r) == 1:
+        return [await import_rapidupload(ctx, file_r[0], util.send_process(ctx, 0, 3))]
+
+    sem = asyncio.Semaphore(config.rules.get('rapidupload_concurrency', 5))
+    bp = util.batch_process(ctx, len(file_r))
+
+    async def run(info):
+        async with sem:
+            try:
+                result = await import_rapidupload(ctx, info)
+            except Exception as e:
+                print(e)
+                result = util.Dict(name=info.name, ok=False, is_local=False, msg=f'{info.name} 获取失败啦\n')
+        await bp.update(result.ok)
+        return result
+
+    results = await asyncio.gather(*[run(info) for info in file_r])
+    await bp.finish()
+    return results
+
+
 # 获取秒传信息
-async def get_ru(ctx, url_str, yun_data, randsk):
+async def get_ru(ctx, url_str, yun_data, randsk, fs_id=None):
     sp = util.send_process(ctx, 0, 3)
-    info = ru.get_rapidupload_info(url_str)
+    info = await ru.get_rapidupload_info(url_str, fs_id=fs_id)
     if not info:
         await sp.send('秒传信息获取失败,正在尝试修复')
-        files = share.transfer(yun_data, randsk, dir_str=share.get_dir_str(ctx.user_id))
+        files = await share.transfer(yun_data, randsk, dir_str=share.get_dir_str(ctx.user_id))
         if not files:
             return '转存失败.修复失败'
         await sp.send('转存成功,正在修复')
         info = []
         for file_path in files:
-            urls = api.get_local_download_link(file_path)
+            urls = await api.get_local_download_link(file_path)
             if not urls:
                 await _bot.send(ctx, f'{file_path} 修复失败')
                 continue
-            real_url = api.get_real_url_by_dlink(urls[0])
+            real_url = await api.get_real_url_by_dlink(urls[0])
             if not real_url:
                 # await _bot.send(ctx, f'{file_path} 本地下载地址获取失败,过段时间在试吧')
                 real_url = urls[0]
-            ru_info = ru.get_rapidupload_info(real_url, ua=api.get_pan_ua())
+            ru_info = await ru.get_rapidupload_info(real_url, ua=api.get_pan_ua())
             if not ru_info:
                 await _bot.send(ctx, f'{file_path} 修复失败,获取内部下载失败')
                 continue
@@ -1,7 +1,6 @@
-import requests
-import json
 from urllib import parse
 
+from .. import ehttp
 from . import util, sign
 
 config = util.get_config()
@@ -25,7 +24,7 @@ def get_randsk_headers(ua=None, randsk=None):
     }
 
 
-def get_real_url_by_dlink(dlink, urls: list = None, ua=None):
+async def get_real_url_by_dlink(dlink, urls: list = None, ua=None):
     if not dlink:
         return ''
     headers = {
@@ -33,34 +32,35 @@ def get_real_url_by_dlink(dlink, urls: list = None, ua=None):
         'Cookie': f'BDUSS={config.BDUSS};',
     }
     try:
-        real_link = requests.get(dlink, headers=headers, timeout=30, allow_redirects=False)
+        real_link = await ehttp.get(dlink, headers=headers, timeout=30, follow_redirects=False)
         if real_link.status_code == 302:
             return real_link.headers.get('Location')
         if real_link.status_code == 403 and urls:
             urls.pop(0)
-            return get_real_url_by_dlink(urls[0], urls, ua=ua)
+            return await get_real_url_by_dlink(urls[0], urls, ua=ua)
         return 'bduss 已过期,请重新获取' if real_link.status_code == 31360 else ''
-    except requests.exceptions.SSLError:
+    except ehttp.ConnectError:
         if not urls or not isinstance(urls, list):
             return ''
         urls.pop(0)
-        return get_real_url_by_dlink(urls[0], urls, ua=ua)
+        return await get_real_url_by_dlink(urls[0], urls, ua=ua)
 
 
 # 获取度盘内的文件真实下载地址
-def get_web_file_url(fs_id: list):
-    sign_str, timestamp = sign.get_web_sign()
+async def get_web_file_url(fs_id: list):
+    sign_str, timestamp = await sign.get_web_sign()
     url = f'https://pan.baidu.com/api/download?type=dlink&channel=chunlei&web=1&app_id=250528&clienttype=0&' \
           f'sign={parse.quote(sign_str)}&timestamp={timestamp}&fidlist=%5B{",".join([str(i) for i in fs_id])}%5D'
-    info = util.dict_to_object(json.loads(requests.get(url, headers=get_randsk_headers(), timeout=30).text))
+    res = await ehttp.get(url, headers=get_randsk_headers(), timeout=30)
+    info = res.json(object_hook=util.Dict)
     if info.errno != 0:
         return []
-    url = [get_real_url_by_dlink(dl['dlink']) for dl in info.dlink]
+    url = [await get_real_url_by_dlink(dl['dlink']) for dl in info.dlink]
     return url
 
 
 # 获取本地下载地址
-def get_local_download_link(path: str):
+async def get_local_download_link(path: str):
     try:
         path = parse.quote(path).replace('/', '%2F')
         s_time, dev_uid, rand = sign.get_sign()
@@ -70,8 +70,8 @@ def get_local_download_link(path: str):
             'User-Agent': get_pan_ua(),
             'Cookie': f'BDUSS={config.BDUSS};'
         }
-        info = util.dict_to_object(
-            json.loads(requests.get(url, headers=headers, timeout=30).text))
+        res = await ehttp.get(url, headers=headers, timeout=30)
+        info = res.json(object_hook=util.Dict)
         if info.get('error_code'):
             return False
         return (
@@ -1,7 +1,6 @@
-import json
 import re
 import base64
-from functools import reduce
+import struct
 from urllib import parse
 
 base64_decodestring = lambda x: base64.decodebytes(x.encode()).decode()
@@ -19,49 +18,44 @@ def parse_bdpan(link: str):
     return list(f)
 
 
+# 游侠(BDLINK)格式
+# BDFS\0 + 文件数(uint32) + 每个文件: 大小(uint64) md5(16) md5s(16) 文件名长度(uint32) 文件名(utf-16le)
+BDFS_HEADER = b'BDFS\x00'
+BDFS_COUNT = struct.Struct('<I')
+BDFS_ITEM = struct.Struct('<Q16s16sI')
+
+
 def parse_ali213(link: str):
     f = re.sub(r'\s', '', link)[len('BDLINK'):]
-    f = bytearray(base64.b64decode(f))
-    if f[:5] != b'BDFS\x00':
+    f = memoryview(base64.b64decode(f))
+    if f[:5] != BDFS_HEADER:
         return None
 
-    def read_number(index, size):
-        return reduce(lambda s, x: (s << 8) + x, reversed(f[index: index + size]), 0)
-
-    def read_uint(index):
-        return read_number(index, 4)
-
-    def read_ulong(index):
-        return read_number(index, 8)
-
-    def read_hex(index, size):
-        return ''.join(map(lambda x: '%02x' % x, f[index: index + size]))
-
-    def read_unicode(index, size):
-        if size & 1:
-            size += 1
-        return json.loads('"%s"' % re.sub(r'(\w{2})(\w{2})', r'\\u\2\1', read_hex(index, size)))
-
-    total = read_uint(5)
+    total, = BDFS_COUNT.unpack_from(f, 5)
     ptr = 9
     ff = []
     for _ in range(total):
-        # size (8 bytes)
-        # MD5 + MD5S (0x20)
-        # nameSize (4 bytes)
-        # Name (unicode)
-        d = dulink()
-        d.size = read_ulong(ptr + 0)
-        d.md5 = read_hex(ptr + 8, 0x10)
-        d.md5s = read_hex(ptr + 0x18, 0x10)
-        name_size = read_uint(ptr + 0x28) << 1
-        ptr += 0x2C
-        d.name = read_unicode(ptr, name_size)
+        size, md5, md5s, name_size = BDFS_ITEM.unpack_from(f, ptr)
+        ptr += BDFS_ITEM.size
+        name_size <<= 1
+        name = str(f[ptr:ptr + name_size], 'utf-16-le')
         ptr += name_size
-        ff.append(d)
+        ff.append(dulink.make(name=name, size=size, md5=md5.hex(), md5s=md5s.hex()))
     return ff
 
 
+def to_ali213(ru_list):
+    ru_list = ru_list if isinstance(ru_list, list) else [ru_list]
+    ru_list = [x if isinstance(x, dulink) else dulink.make(**x) for x in ru_list]
+    buf = bytearray(BDFS_HEADER)
+    buf += BDFS_COUNT.pack(len(ru_list))
+    for x in ru_list:
+        name = x.name.encode('utf-16-le')
+        buf += BDFS_ITEM.pack(int(x.size), bytes.fromhex(x.md5), bytes.fromhex(x.md5s), len(name) >> 1)
+        buf += name
+    return 'BDLINK' + base64.b64encode(buf).decode()
+
+
 def parse_pcsgo(link: str):
     f = link.split('\n')
     f = map(lambda x: x.strip(), f)
@@ -1,14 +1,15 @@
-import requests
-import json
 import hashlib
 import re
+from .. import ehttp
 from . import util, api, dupan_link
 
 config = util.get_config()
+# 已经获取过的秒传信息 key为分享文件的fs_id
+db = util.init_db(config.get('cache_dir', './data/'), 'rapidupload.sqlite')
 
 
 # 保存秒传文件 文件md5值
-def rapidupload(md5, md5s, size, file_name, dir_name='temp/'):
+async def rapidupload(md5, md5s, size, file_name, dir_name='temp/'):
     url = 'https://pan.baidu.com/api/rapidupload?channel=chunlei&clienttype=0&web=1&app_id=250528&rtype=3'
     data = {
         'path': f'{dir_name}{file_name}',
@@ -16,27 +17,31 @@ def rapidupload(md5, md5s, size, file_name, dir_name='temp/'):
         'slice-md5': md5s,
         'content-length': str(size)
     }
-    res = json.loads(requests.post(url, data=data, headers=api.get_randsk_headers(), timeout=30).text)
+    res = (await ehttp.post(url, data=data, headers=api.get_randsk_headers(), timeout=30)).json()
     return None if res['errno'] != 0 else res['info']
 
 
-# 根据下载链接获取秒传信息
-def get_rapidupload_info(download_link, ua=None):
+# 根据下载链接获取秒传信息 有fs_id的话优先使用保存过的
+async def get_rapidupload_info(download_link, ua=None, fs_id=None):
+    if fs_id and (saved := db.get(str(fs_id))):
+        return dupan_link.dulink.make(**saved)
     try:
         headers = {
             'User-Agent': ua or api.get_pan_ua(),
             'Cookie': f'BDUSS={config.BDUSS};',
             'Range': 'bytes=0-262143',
         }
-        res = requests.get(download_link, headers=headers, timeout=30, allow_redirects=False)
+        res = await ehttp.get(download_link, headers=headers, timeout=30, follow_redirects=False)
         md5 = res.headers.get('Content-MD5').upper()
         md5s = hashlib.new('md5', res.content).hexdigest().upper()
         size = res.headers.get('x-bs-file-size')
-        file_name = re.search(
-            r'filename="(.+)"', res.headers.get('Content-Disposition')
-        )[1]
-        file_name = file_name.encode('raw_unicode_escape').decode('utf-8')
-        return dupan_link.dulink.make(file_name, size, md5, md5s)
+        # 文件名是utf-8 直接从原始的header里取
+        disposition = next(v for k, v in res.headers.raw if k.lower() == b'content-disposition')
+        file_name = re.search(rb'filename="(.+)"', disposition)[1].decode('utf-8')
+        info = dupan_link.dulink.make(file_name, size, md5, md5s)
+        if fs_id:
+            db[str(fs_id)] = vars(info)
+        return info
     except Exception as e:
         print(e)
         return None
@@ -1,11 +1,13 @@
-import requests
+import asyncio
 import base64
 import json
 import re
 import datetime
+import itertools
 import nonebot
 from urllib import parse
 
+from .. import ehttp
 from . import util, api
 
 config = util.get_config()
@@ -25,8 +27,12 @@ def get_surl(pan_url: str):
     return surl, pwd
 
 
+share_cache_time = datetime.timedelta(minutes=config.rules.get('share_cache_time', 30))
+
+
 # 验证网盘密码
-def verify(surl: str, pwd=None):
+@util.cache(ttl=share_cache_time)
+async def verify(surl: str, pwd=None):
     headers = {
         'user-agent': 'netdisk',
         'Referer': 'https://pan.baidu.com/disk/home'
@@ -34,11 +40,11 @@ def verify(surl: str, pwd=None):
 
     if pwd:
         url = f'https://pan.baidu.com/share/verify?channel=chunlei&clienttype=0&web=1&app_id=250528&surl={surl}'
-        res = json.loads(requests.post(url, data={'pwd': f'{pwd}'.strip()}, headers=headers, timeout=30).text)
+        res = (await ehttp.post(url, data={'pwd': f'{pwd}'.strip()}, headers=headers, timeout=30)).json()
         return res['randsk'] if res['errno'] == 0 else False
     else:
         url = f'https://pan.baidu.com/s/1{surl}'
-        res = requests.get(url, headers=headers, timeout=30, allow_redirects=False)
+        res = await ehttp.get(url, headers=headers, timeout=30, follow_redirects=False)
         if res.status_code == 302:
             return False
         cookie = res.headers.get('set-cookie')
@@ -48,118 +54,226 @@ def verify(surl: str, pwd=None):
         return False
 
 
-# 网盘验证成功后获取分享数据
-def get_yun_data(surl: str, randsk: str):
+# 获取分享页面里的分享数据
+@util.cache(ttl=share_cache_time)
+async def get_yun_data_str(surl: str, randsk: str):
     url = f'https://pan.baidu.com/s/1{surl}'
-    res = requests.get(url, headers=api.get_randsk_headers(randsk=randsk), timeout=30).text
+    res = (await ehttp.get(url, headers=api.get_randsk_headers(randsk=randsk), timeout=30)).text
     data_str = re.search(r'yunData.setData\(({.+)\);', res) or re.search(r'locals.mset\(({.+)\);', res)
-    return (
-        util.dict_to_object(json.loads(data_str.group(1)))
-        if data_str
-        else False
-    )
+    return data_str.group(1) if data_str else ''
+
+
+# 网盘验证成功后获取分享数据
+async def get_yun_data(surl: str, randsk: str):
+    # 每次重新解析 后面会修改这个对象
+    data_str = await get_yun_data_str(surl, randsk)
+    return util.dict_to_object(json.loads(data_str)) if data_str else False
 
 
 # 获取文件列表
-def get_file_list(shareid, uk, randsk, dir_str=None):
+async def get_file_list(shareid, uk, randsk, dir_str=None, page=1, num=100):
     root = 0 if dir_str else 1
     dir_str = f'&dir={parse.quote(dir_str)}' if dir_str else ''
-    url = 'https://pan.baidu.com/share/list?app_id=250528&channel=chunlei&clienttype=0&desc=0&num=100&order=name&page=1&root='
+    url = f'https://pan.baidu.com/share/list?app_id=250528&channel=chunlei&clienttype=0&desc=0&num={num}&order=name&page={page}&root='
     url += f'{root}&shareid={shareid}&showempty=0&uk={uk}{dir_str}&web=1'
-    return util.dict_to_object(
-        json.loads(requests.get(url, headers=api.get_randsk_headers(randsk=randsk), timeout=30).text))
+    res = await ehttp.get(url, headers=api.get_randsk_headers(randsk=randsk), timeout=30)
+    return res.json(object_hook=util.Dict)
 
 
-# 获取真实下载地址
-def get_file_dl_link(fs_id, share_id, uk, randsk, sign, timestamp):
+# 分页获取一个目录下的全部文件, 每获取到一页就返回一页
+async def iter_file_pages(shareid, uk, randsk, dir_str=None, num=100, first_page=None):
+    for page in itertools.count(1):
+        if page == 1 and first_page:
+            file_list = first_page
+        else:
+            file_list = await get_file_list(shareid, uk, randsk, dir_str=dir_str, page=page, num=num)
+        if file_list.errno != 0:
+            print(f'获取文件列表失败: {dir_str} 第{page}页 errno: {file_list.errno}')
+            return
+        yield file_list
+        if len(file_list.list) < num:
+            return
+
+
+# 遍历分享目录, 边获取边返回每个文件
+# recursive 时同时遍历子目录(按层级先后), 最多同时获取 concurrency 个目录
+async def iter_file_list(shareid, uk, randsk, dir_str=None, recursive=False, concurrency=3, first_page=None):
+    queue = asyncio.Queue()
+    sem = asyncio.Semaphore(concurrency)
+    tasks = []
+
+    async def walk(path, first=None):
+        try:
+            async with sem:
+                async for file_list in iter_file_pages(shareid, uk, randsk, dir_str=path, first_page=first):
+                    for file in file_list.list:
+                        await queue.put(util.dict_to_object(file))
+        except Exception as e:
+            await queue.put(e)
+        finally:
+            # 这个目录获取完毕
+            await queue.put(None)
+
+    def start(path, first=None):
+        tasks.append(asyncio.ensure_future(walk(path, first)))
+
+    start(dir_str, first_page)
+    running = 1
+    try:
+        while running:
+            file = await queue.get()
+            if file is None:
+                running -= 1
+                continue
+            if isinstance(file, Exception):
+                raise file
+            if recursive and int(file.isdir) == 1:
+                start(file.path)
+                running += 1
+            yield file
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+# 获取分享的sign和timestamp 每个分享只需要获取一次
+async def get_share_sign(surl, yun_data, randsk):
+    if yun_data.get('sign'):
+        return yun_data.sign, yun_data.timestamp
+    url = f'https://pan.baidu.com/share/tplconfig?surl=1{surl}&fields=sign,timestamp&channel=chunlei&web=1&app_id=250528&clienttype=0'
+    res = await ehttp.get(url, headers=api.get_randsk_headers(randsk=randsk), timeout=30)
+    get_sign = res.json(object_hook=util.Dict).data
+    return get_sign.sign, get_sign.timestamp
+
+
+# 一次获取多个文件的dlink 返回 {fs_id: dlink}
+async def get_file_dlinks(fs_ids: list, share_id, uk, randsk, sign, timestamp):
     url = 'https://pan.baidu.com/api/sharedownload?app_id=250528&channel=chunlei&clienttype=12&sign='
     url += f'{sign}&timestamp={timestamp}&web=1'
     data = {
         "encrypt": 0,
         "extra": json.dumps({"sekey": parse.unquote(randsk)}),
-        "fid_list": f'[{fs_id}]',
+        "fid_list": f'[{",".join([str(i) for i in fs_ids])}]',
         "primaryid": share_id,
         "uk": uk,
         "product": 'share',
         "type": 'nolimit'
     }
-    res = requests.post(url, data=data, headers=api.get_randsk_headers(randsk=randsk), timeout=30)
-    res = util.dict_to_object(json.loads(res.text))
+    res = await ehttp.post(url, data=data, headers=api.get_randsk_headers(randsk=randsk), timeout=30)
+    res = res.json(object_hook=util.Dict)
     if res.errno != 0:
-        return False
-
-    return api.get_real_url_by_dlink(res.list[0]['dlink'])
-
-
-def handle_file_list(surl, file_list, yun_data, randsk):
-    file_info = []
+        return {}
+    if len(fs_ids) == 1:
+        return {fs_ids[0]: res.list[0]['dlink']}
+    return {x['fs_id']: x['dlink'] for x in res.list}
+
+
+# 并发获取多个文件的真实下载地址 返回 {fs_id: url}
+async def get_file_dl_links(fs_ids: list, share_id, uk, randsk, sign, timestamp):
+    batch_size = config.rules.get('dlink_batch_size', 20)
+    sem = asyncio.Semaphore(config.rules.get('dlink_concurrency', 5))
+    dlinks = {}
+
+    async def fetch_dlinks(ids):
+        async with sem:
+            links = await get_file_dlinks(ids, share_id, uk, randsk, sign, timestamp)
+        if links or len(ids) == 1:
+            dlinks.update(links)
+            return
+        # 批量获取失败的话 逐个获取
+        await asyncio.gather(*[fetch_dlinks([i]) for i in ids])
+
+    async def fetch_url(fs_id):
+        if not dlinks.get(fs_id):
+            return False
+        async with sem:
+            return await api.get_real_url_by_dlink(dlinks[fs_id])
+
+    await asyncio.gather(*[
+        fetch_dlinks(fs_ids[i:i + batch_size])
+        for i in range(0, len(fs_ids), batch_size)
+    ])
+    urls = await asyncio.gather(*[fetch_url(fs_id) for fs_id in fs_ids])
+    return dict(zip(fs_ids, urls))
+
+
+async def resolve_files(surl, files, yun_data, randsk):
+    sign, timestamp = await get_share_sign(surl, yun_data, randsk)
+    # 同一个分享后面的批次不用再获取sign
+    yun_data.sign, yun_data.timestamp = sign, timestamp
+    urls = await get_file_dl_links(
+        [file.fs_id for file in files],
+        share_id=yun_data.shareid,
+        uk=yun_data.uk,
+        randsk=randsk,
+        sign=sign,
+        timestamp=timestamp
+    )
+    return [{
+        'fs_id': file.fs_id,
+        'name': f'{file.server_filename}',
+        'url': urls[file.fs_id],
+        'size': int(file.size),
+        'image': yun_data['photo']
+    } for file in files]
+
+
+# 边获取文件列表边解析下载地址, 每解析完一批返回一次 (目录列表, 文件信息列表)
+# 只有一个目录的分享会直接进入这个目录
+async def iter_file_info(surl, yun_data, randsk, dir_str=None, recursive=False, first_page=None):
+    batch_size = config.rules.get('dlink_batch_size', 20)
     msg_dir_str = []
-
-    for file in file_list.list:
-        file = util.dict_to_object(file)
-
+    files = []
+    # 一共有多少个文件 files 每批发出去后会清空
+    seen_files = 0
+    async for file in iter_file_list(yun_data.shareid, yun_data.uk, randsk,
+                                     dir_str=dir_str,
+                                     recursive=recursive,
+                                     concurrency=config.rules.get('list_concurrency', 3),
+                                     first_page=first_page):
         if int(file.isdir) == 1:
-            if len(file_list.list) == 1:
-                file_list = get_file_list(yun_data.shareid, yun_data.uk, randsk, dir_str=file.path)
-                if file_list.errno != 0:
-                    return msg_dir_str, file_info
-                return handle_file_list(surl, file_list, yun_data, randsk)
-            msg_dir_str.append(file.path)
+            if not recursive:
+                msg_dir_str.append(file.path)
             continue
+        files.append(file)
+        seen_files += 1
+        if len(files) >= batch_size:
+            yield [], await resolve_files(surl, files, yun_data, randsk)
+            files = []
 
-        if yun_data.get('sign'):
-            sign = yun_data.sign
-            timestamp = yun_data.timestamp
-        else:
-            url = f'https://pan.baidu.com/share/tplconfig?surl=1{surl}&fields=sign,timestamp&channel=chunlei&web=1&app_id=250528&clienttype=0'
-            res = requests.get(url, headers=api.get_randsk_headers(randsk=randsk), timeout=30)
-            get_sign = util.dict_to_object(json.loads(res.text)).data
-            sign = get_sign.sign
-            timestamp = get_sign.timestamp
-
-        dl_link = get_file_dl_link(
-            fs_id=file.fs_id,
-            share_id=yun_data.shareid,
-            uk=yun_data.uk,
-            randsk=randsk,
-            sign=sign,
-            timestamp=timestamp
-        )
-
-        file_info.append({
-            'fs_id': file.fs_id,
-            'name': f'{file.server_filename}',
-            'url': dl_link,
-            'size': int(file.size),
-            'image': yun_data['photo']
-        })
-    return msg_dir_str, file_info
+    if not seen_files and len(msg_dir_str) == 1:
+        async for item in iter_file_info(surl, yun_data, randsk, dir_str=msg_dir_str[0], recursive=recursive):
+            yield item
+        return
+
+    if files or msg_dir_str:
+        yield msg_dir_str, files and await resolve_files(surl, files, yun_data, randsk)
 
 
 # 取消分享
-def cancel_share(shareid):
+async def cancel_share(shareid):
     shareid = shareid if isinstance(shareid, list) else [shareid]
     url = 'https://pan.baidu.com/share/cancel?channel=chunlei&clienttype=0&web=1&channel=chunlei&web=1&app_id=250528&clienttype=0'
     shareid = ",".join([str(i) for i in shareid])
     data = {
         "shareid_list": f'[{shareid}]',
     }
-    res = util.dict_to_object(
-        json.loads(requests.post(url, data=data, headers=api.get_randsk_headers(), timeout=30).text))
+    res = await ehttp.post(url, data=data, headers=api.get_randsk_headers(), timeout=30)
+    res = res.json(object_hook=util.Dict)
 
     return res.errno == 0, res.err_msg
 
 
 # 删除文件
-def delete_share(file_path):
+async def delete_share(file_path):
     file_path = file_path if isinstance(file_path, list) else [file_path]
     url = 'https://pan.baidu.com/api/filemanager?opera=delete&async=2&onnest=fail&channel=chunlei&web=1&app_id=250528&clienttype=0'
     file_path = ",".join([f'"{i}"' for i in file_path])
     data = {
         "filelist": f'[{file_path}]',
     }
-    res = util.dict_to_object(
-        json.loads(requests.post(url, data=data, headers=api.get_randsk_headers(), timeout=30).text))
+    res = await ehttp.post(url, data=data, headers=api.get_randsk_headers(), timeout=30)
+    res = res.json(object_hook=util.Dict)
 
     return res.errno == 0, res.taskid
 
@@ -170,18 +284,18 @@ def auto_cancel_share(shareid, file_path):
         'date',
         run_date=datetime.datetime.now() + datetime.timedelta(hours=config.rules.auto_cancel_share_time)
     )
-    def _():
-        ok, err_msg = cancel_share(shareid)
+    async def _():
+        ok, err_msg = await cancel_share(shareid)
         if not ok:
             print(err_msg)
         if config.rules.delete_share_file:
-            ok, taskid = delete_share(file_path)
+            ok, taskid = await delete_share(file_path)
             if not ok:
                 print('删除分享文件失败')
 
 
 # 设置分享文件
-def set_share(fs_id, pwd='erin', expire_time=1):
+async def set_share(fs_id, pwd='erin', expire_time=1):
     fs_id = fs_id if isinstance(fs_id, list) else [fs_id]
     url = 'https://pan.baidu.com/share/set?channel=chunlei&clienttype=0&web=1&channel=chunlei&web=1&app_id=250528&clienttype=0'
     fs_id = ",".join([str(i) for i in fs_id])
@@ -192,14 +306,14 @@ def set_share(fs_id, pwd='erin', expire_time=1):
         "pwd": pwd,
         "fid_list": f'[{fs_id}]',
     }
-    res = util.dict_to_object(
-        json.loads(requests.post(url, data=data, headers=api.get_randsk_headers(), timeout=30).text))
+    res = await ehttp.post(url, data=data, headers=api.get_randsk_headers(), timeout=30)
+    res = res.json(object_hook=util.Dict)
 
     return (False, 0) if res.errno != 0 else (res.link, res.shareid)
 
 
 # 创建目录
-def create_dir(dir_str):
+async def create_dir(dir_str):
     url = 'https://pan.baidu.com/api/create?a=commit&channel=chunlei&app_id=250528&channel=chunlei&web=1&app_id=250528&clienttype=0&'
     # url += 'bdstoken=%s&logid=%s' % (yun_data.bdstoken, logid)
     data = {
@@ -210,8 +324,8 @@ def create_dir(dir_str):
         'method': 'post',
         'dataType': 'json'
     }
-    res = requests.post(url, data=data, headers=api.get_randsk_headers(), timeout=30)
-    res = util.dict_to_object(json.loads(res.text))
+    res = await ehttp.post(url, data=data, headers=api.get_randsk_headers(), timeout=30)
+    res = res.json(object_hook=util.Dict)
     return res.path if res.errno == 0 else ''
 
 
@@ -220,7 +334,7 @@ def get_dir_str(dir_str='default'):
 
 
 # 保存分享文件
-def transfer(yun_data, randsk, dir_str=get_dir_str(), init_dir=False):
+async def transfer(yun_data, randsk, dir_str=get_dir_str(), init_dir=False):
     logid = base64.b64encode(config.BAIDUID.encode()).decode()
     url = 'https://pan.baidu.com/share/transfer?channel=chunlei&web=1&app_id=250528&clienttype=0&'
     url += f'shareid={yun_data.shareid}&from={yun_data.uk}&bdstoken={yun_data.bdstoken}&logid={logid}'
@@ -231,15 +345,15 @@ def transfer(yun_data, randsk, dir_str=get_dir_str(), init_dir=False):
         "fsidlist": f'[{fs_ids}]',
         'path': dir_str
     }
-    res = requests.post(url, data=data, headers=api.get_randsk_headers(randsk=randsk), timeout=30)
-    res = util.dict_to_object(json.loads(res.text))
+    res = await ehttp.post(url, data=data, headers=api.get_randsk_headers(randsk=randsk), timeout=30)
+    res = res.json(object_hook=util.Dict)
     if res.errno == 2 and not init_dir:
         # 创建目录
-        has_create = create_dir(dir_str)
+        has_create = await create_dir(dir_str)
         if not has_create:
             print(f'创建目录失败: {dir_str}')
             return False
-        return transfer(yun_data, randsk, has_create, True)
+        return await transfer(yun_data, randsk, has_create, True)
     try:
         return list(map(lambda x: dir_str + x['path'], res.info))
     except Exception as e:
@@ -1,8 +1,8 @@
-import requests
 import hashlib
 import time
 import json
 
+from .. import ehttp
 from . import util, api
 
 config = util.get_config()
@@ -69,9 +69,9 @@ sign = ''
 timestamp = 0
 
 
-def gen_web_sign():
+async def gen_web_sign():
     url = 'https://pan.baidu.com/api/gettemplatevariable?app_id=250528&channel=chunlei&clienttype=0&fields=[%22sign1%22,%22sign2%22,%22sign3%22,%22timestamp%22]&web=1'
-    text = requests.get(url, headers=api.get_randsk_headers(), timeout=30).text
+    text = (await ehttp.get(url, headers=api.get_randsk_headers(), timeout=30)).text
     try:
         info = json.loads(text)
     except json.JSONDecodeError:
@@ -88,10 +88,10 @@ def gen_web_sign():
     return sign, timestamp
 
 
-def get_web_sign():
+async def get_web_sign():
     if timestamp + config.rules.sign_cache_time * 60 * 60 < time.time() or timestamp == 0:
         print('刷新sign')
-        return gen_web_sign()
+        return await gen_web_sign()
     return sign, timestamp
 
 
@@ -1,6 +1,9 @@
 # -*- coding: UTF-8 -*-
-# from sqlitedict import SqliteDict
+from collections import OrderedDict
+from sqlitedict import SqliteDict
 from nonebot import *
+import datetime
+import functools
 import yaml
 import time
 import json
@@ -55,14 +58,41 @@ db = {}
 
 
 # 初始化数据库
-# def init_db(db_dir, db_name='db.sqlite') -> SqliteDict:
-#     if db.get(db_name):
-#         return db[db_name]
-#     db[db_name] = SqliteDict(get_path(db_dir, db_name),
-#                              encode=json.dumps,
-#                              decode=json.loads,
-#                              autocommit=True)
-#     return db[db_name]
+def init_db(db_dir, db_name='db.sqlite') -> SqliteDict:
+    if db.get(db_name):
+        return db[db_name]
+    db[db_name] = SqliteDict(get_path(db_dir, db_name),
+                             encode=json.dumps,
+                             decode=json.loads,
+                             autocommit=True)
+    return db[db_name]
+
+
+# 缓存异步函数的结果 只缓存成功(不为空)的结果
+def cache(ttl=datetime.timedelta(hours=1), maxsize=256):
+    ttl = ttl.total_seconds()
+
+    def wrap(func):
+        cache_data = OrderedDict()
+
+        @functools.wraps(func)
+        async def wrapped(*args, **kw):
+            key = (args, tuple(sorted(kw.items())))
+            data = cache_data.get(key)
+            if data and time.time() - data[0] < ttl:
+                cache_data.move_to_end(key)
+                return data[1]
+            value = await func(*args, **kw)
+            if value:
+                cache_data[key] = (time.time(), value)
+                cache_data.move_to_end(key)
+                if len(cache_data) > maxsize:
+                    cache_data.popitem(last=False)
+            return value
+
+        return wrapped
+
+    return wrap
 
 
 # 寻找MessageSegment里的某个关键字的位置
@@ -135,6 +165,45 @@ class send_process:
         self.msg_id = res['message_id']
 
 
+# 批量任务的进度 只保留一条进度消息, 更新时撤回上一条
+class batch_process:
+    def __init__(self, ctx, total, interval=3, size=10):
+        self.ctx = ctx
+        self.total = total
+        self.interval = interval
+        self.size = size
+        self.done = 0
+        self.failed = 0
+        self.msg_id = None
+        self.last_time = 0
+
+    async def update(self, ok=True):
+        self.done += 1
+        if not ok:
+            self.failed += 1
+        if time.time() - self.last_time < self.interval:
+            return
+        self.last_time = time.time()
+        await self.__send__()
+
+    async def finish(self):
+        await self.__send__()
+
+    async def __send__(self):
+        index = self.done * self.size // self.total
+        msg = ''.join(['▓'] * index + ['░'] * (self.size - index))
+        msg += f' 秒传导入 {self.done}/{self.total}'
+        if self.failed:
+            msg += f' 失败{self.failed}个'
+        try:
+            if self.msg_id:
+                await bot.delete_msg(message_id=self.msg_id)
+        except Exception as e:
+            print(e)
+        res = await bot.send(self.ctx, msg)
+        self.msg_id = res['message_id']
+
+
 def escape(url: str, cq=None):
     url = url.replace(r'&', '&amp;') \
         .replace(r'\[', '&#91;').replace(r'\]', '&#93;')
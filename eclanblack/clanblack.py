@@ -1,9 +1,8 @@
-import json
 import time
-import requests
-import asyncio
 from hoshino import Service
 from hoshino.typing import CQEvent
+from .. import ehttp
+from ..ehttp import startup
 
 sv = Service('clanblack')
 
@@ -33,6 +32,10 @@ clan_black_list_data = []
 
 @sv.on_prefix('失信')
 async def prc_cbl(bot, ev: CQEvent):
+    # 启动时获取失败的话 等定时任务拿到数据也能用
+    if not clan_black_list_data:
+        await bot.send(ev, '黑名单数据还在加载, 请稍后再试')
+        return
     cbl_list = filter_cbl(ev.message.extract_plain_text().strip())
     await print_cbl(cbl_list, bot, ev)
 
@@ -64,23 +67,27 @@ def filter_cbl(target):
 async def update_black_list():
     try:
         url = f'https://docs.qq.com/dop-api/opendoc?outformat=1&normal=1&preview_token=&t={int(time.time())}&id=DV1JqSHJ5aEVNUG1q&tab=BB08J2'
-        info = json.loads(requests.get(url).text)
+        info = (await ehttp.get(url)).json()
         sheet = info['clientVars']['collab_client_vars']['initialAttributedText']['text'][0][6][0]['c'][1]
         sheet_list = list_split(
             list(sheet.values()), blank_column + blank_head + data_count
         )[keep_head_column:]
-        clan_black_list_data.clear()
+        data = []
         for info in sheet_list:
             black_list = [
                 f'{item["2"][1]}' if item.get('2') else ''
                 for item in info[blank_head : blank_head + data_count]
             ]
             if ''.join(black_list).strip():
-                clan_black_list_data.append(dict(zip(data_name, black_list)))
+                data.append(dict(zip(data_name, black_list)))
+        # 全部解析完再替换 失败的话保留原来的数据
+        clan_black_list_data[:] = data
         print('定时任务: 更新工会战黑名单成功')
+        return True
     except Exception as e:
         print(e)
         print('定时任务: 更新工会战黑名单失败')
+        return False
 
 
 def list_split(items, n):
@@ -88,13 +95,10 @@ def list_split(items, n):
 
 
 # 程序启动的时候获取一下数据
-def run_event_loop():
-    loop = asyncio.new_event_loop()
-    loop.run_until_complete(update_black_list())
-    loop.close()
-
-
-run_event_loop()
+@startup.warmup('eclanblack.black_list')
+async def init_black_list():
+    if not await update_black_list():
+        raise Exception('获取黑名单失败')
 
 
 # 每天0点更新一下数据
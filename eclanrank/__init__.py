@@ -41,18 +41,18 @@ async def epck_main(*params):
     # 查询会战
     keyword = util.get_msg_keyword(config['comm']['keyword'], msg, True)
     if keyword:
-        return await bot.send(ctx, clanrank.get_rank(keyword))
+        return await bot.send(ctx, await clanrank.get_rank(keyword))
     # 会战锁定
     keyword = util.get_msg_keyword(config['comm']['locked'], msg, True)
     if keyword:
-        return await bot.send(ctx, locked.lock(ctx, keyword))
+        return await bot.send(ctx, await locked.lock(ctx, keyword))
     # 会战解锁
     keyword = util.get_msg_keyword(config['comm']['unlocked'], msg, True)
     if keyword:
-        return await bot.send(ctx, locked.unlock(ctx, keyword))
+        return await bot.send(ctx, await locked.unlock(ctx, keyword))
     # 会战锁定查询
     keyword = util.get_msg_keyword(config['comm']['defaultLucked'], msg, True)
     if keyword == '':
-        return await bot.send(ctx, locked.default_rank(ctx['group_id']))
+        return await bot.send(ctx, await locked.default_rank(ctx['group_id']))
 
 
@@ -1,10 +1,10 @@
 from typing import List
 import time
-import asyncio
 import math
 import nonebot
 from nonebot import *
 from nonebot.log import logger
+from ..ehttp import startup
 from . import query
 from . import util
 
@@ -13,7 +13,7 @@ config = util.get_config()
 line_db = util.init_db(config.cache_dir, 'line.sqlite')
 
 
-def get_rank(keyword):
+async def get_rank(keyword):
     # 首先不管怎么样先转换到字符串
     keyword = f'{keyword}'.strip()
 
@@ -31,13 +31,13 @@ def get_rank(keyword):
     else:
         params['name'] = keyword
 
-    info, ts = query.get_rank(**params)
+    info, ts = await query.get_rank(**params)
 
-    return print_rank(info, ts=ts) if info else '木有找到相关的工会'
+    return await print_rank(info, ts=ts) if info else '木有找到相关的工会'
 
 
-def print_rank(info, new_info=None, ts=None):
-    res = query.get_line()
+async def print_rank(info, new_info=None, ts=None):
+    res = await query.get_line()
     res.reverse()
     line_db['line'] = res
 
@@ -67,7 +67,7 @@ def print_rank(info, new_info=None, ts=None):
         if line := line_db.get('line', []):
             target = util.filter_list(line, lambda x: x['damage'] > data.damage)
             if not target:
-                info, ts = query.get_rank(rank=1)
+                info, ts = await query.get_rank(rank=1)
                 target = [info[0].data]
             target = target[0]
             message.append(
@@ -76,20 +76,14 @@ def print_rank(info, new_info=None, ts=None):
     return message[:-1]
 
 
+@startup.warmup('eclanrank.line')
 async def update_line():
-    res = query.get_line()
+    res = await query.get_line()
     if not res:
         logger.error('档线更新失败。 请检查相关设置')
-        return
+        # 抛出异常 启动任务才不会标记为完成
+        raise Exception('档线更新失败')
     res.reverse()
     line_db['line'] = res
     logger.info('定时任务：更新会战档线成功')
 
-
-def run_init():
-    loop = asyncio.new_event_loop()
-    loop.run_until_complete(update_line())
-    loop.close()
-
-
-run_init()
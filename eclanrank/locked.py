@@ -37,17 +37,17 @@ def __check_params__(ctx, target):
     return False, '', name, uid
 
 
-def lock(ctx, target):
+async def lock(ctx, target):
     failed, msg, name, uid = __check_params__(ctx, target)
     if failed:
         return msg
 
-    info, ts = query.get_rank(name=name)
+    info, ts = await query.get_rank(name=name)
     if not info:
         return '锁定失败 木有找到相关工会'
 
     if len(info) > 1 and not uid:
-        msg = clanrank.print_rank(info, ts=ts)
+        msg = await clanrank.print_rank(info, ts=ts)
         msg.append(MessageSegment.text(f'\n找到多个公会请详细指定公会名，如重复使用[ 会战锁定{name}#UID ]来锁定'))
         return msg
 
@@ -79,7 +79,7 @@ def __save_lock__(info, group_id, uid=0, update=False):
     return '锁定成功~ 可以直接使用会战查询本公会，不需要带名字'
 
 
-def unlock(ctx, target):
+async def unlock(ctx, target):
     failed, msg, name, uid = __check_params__(ctx, target)
     if failed:
         return msg
@@ -90,7 +90,7 @@ def unlock(ctx, target):
     info = util.filter_list(group, lambda x: x['clan_name'] == name)
 
     if len(info) > 1 and not uid:
-        msg = clanrank.print_rank(info)
+        msg = await clanrank.print_rank(info)
         msg.append(MessageSegment.text(f'\n解锁失败 [ 会战锁定{name}#UID ]来解除'))
         return msg
 
@@ -120,18 +120,18 @@ def __failed_get_info__(info):
     return f'检查不到这公会的数据了 可到 https://kengxxiao.github.io/Kyouka/ 查询 也或者 会战解锁{info["clan_name"]}#{info["leader_viewer_id"]}'
 
 
-def default_rank(group_id):
+async def default_rank(group_id):
     group = db.get(group_id, [])
     if not group:
         return '还没有绑定公会呢 快用 会战锁定公会名 来进行绑定'
     res = []
     for value in group:
-        info, ts = query.get_rank(name=value['clan_name'], uid=value['leader_viewer_id'])
+        info, ts = await query.get_rank(name=value['clan_name'], uid=value['leader_viewer_id'])
         if not info:
             return __failed_get_info__(value)
         res.append(*info)
 
-    return clanrank.print_rank(res, ts=ts)
+    return await clanrank.print_rank(res, ts=ts)
 
 
 async def check_rank_state():
@@ -141,7 +141,7 @@ async def check_rank_state():
     group_list = groupby(sum(db.values(), []), lambda x: x['clan_name'])
     for key, group in group_list:
         logger.info(f'正在更新：{key} 公会')
-        info, ts = query.get_rank(name=key)
+        info, ts = await query.get_rank(name=key)
         for data in group:
             group_id = data['group_id']
             # 如果这公会不存在了就广播吧
@@ -153,7 +153,7 @@ async def check_rank_state():
                 util.filter_list(info, lambda x: x.leader_viewer_id == data['leader_viewer_id'])[0]
             try:
                 await bot.send_group_msg(group_id=group_id,
-                                         message=clanrank.print_rank(query.get_rank_response(data), new_info, ts=ts))
+                                         message=await clanrank.print_rank(query.get_rank_response(data), new_info, ts=ts))
             except Exception as e:
                 if e == 103:
                     logger.info(f'群：{group_id} 不存在')
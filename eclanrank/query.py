@@ -2,8 +2,7 @@ from typing import List
 import time
 import datetime
 import math
-import json
-import requests
+from .. import ehttp
 from . import util
 from nonebot.log import logger
 
@@ -48,7 +47,7 @@ class get_rank_response:
         self.data['group_id'] = group_id
 
 
-def get_rank(
+async def get_rank(
         rank: int = 0,
         name: str = '',
         leader: str = '',
@@ -86,7 +85,7 @@ def get_rank(
 
     url = f'{config.rules.base_url}{last_api}{(rank if rank != -1 else 0)}'
     headers = config.rules.headers
-    info = json.loads(requests.post(url, json=last_req, headers=headers, timeout=20).text)
+    info = (await ehttp.post(url, json=last_req, headers=headers, timeout=20)).json()
 
     if info['code'] > 0:
         logger.info(info['msg'])
@@ -106,10 +105,10 @@ def get_rank(
     )
 
 
-def get_line() -> List or bool:
+async def get_line() -> List or bool:
     url = f'{config.rules.base_url}/line'
     headers = config.rules.headers
-    info = json.loads(requests.post(url, json={}, headers=headers, timeout=20).text)
+    info = (await ehttp.post(url, json={}, headers=headers, timeout=20)).json()
     if info['code'] > 0:
         logger.info(info['msg'])
         return False
@@ -107,7 +107,7 @@ async def request_data(top_type, url, keep_head, keep_row, field_count,
     return result
 
 
-@cache(ttl=timedelta(hours=24))
+@cache(ttl=timedelta(hours=24), stale_ttl=timedelta(hours=24))
 async def achievements_sheet(top_type='天地万象'):
     result = {}
     data = await request_data(*((top_type, ) + get_all_achievements_api()))
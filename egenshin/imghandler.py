@@ -1,18 +1,18 @@
 import math
 from PIL import Image, ImageDraw, ImageFont, ImageOps
-from hoshino import aiorequests
 from io import BytesIO
+from .. import ehttp
 from .util import get_font, pil2b64
 
 
-async def get_pic(url, size=None, *args, **kwargs) -> Image:
+async def get_pic(url, size=None, **kwargs) -> Image:
     """
     从网络获取图片，格式化为RGBA格式的指定尺寸
     """
-    resp = await aiorequests.get(url, stream=True, *args, **kwargs)
+    resp = await ehttp.get(url, **kwargs)
     if resp.status_code != 200:
         return None
-    pic = Image.open(BytesIO(await resp.content))
+    pic = Image.open(BytesIO(resp.content))
     pic = pic.convert("RGBA")
     if size is not None:
         pic = pic.resize(size, Image.LANCZOS)
@@ -1,6 +1,6 @@
-import asyncio
 import datetime
 from apscheduler.triggers.date import DateTrigger
+from ...ehttp import startup
 from ..util import *
 
 material_db = init_db(config.cache_dir, 'material.sqlite')
@@ -100,6 +100,7 @@ class material:
         return '\n'.join(msg) if msg else '你还没有任何设定的材料, 请使用 收集材料#材料名字 进行设定'
 
 
+@startup.warmup('egenshin.material')
 async def init_material_job():
     if material_db:
         for user in material_db:
@@ -110,11 +111,3 @@ async def init_material_job():
                 mat = material(job['group'], job['uid'])
                 await mat.mark(job['name'], job['datetime'])
 
-
-def run_material_init():
-    loop = asyncio.new_event_loop()
-    loop.run_until_complete(init_material_job())
-    loop.close()
-
-
-run_material_init()
@@ -8,8 +8,7 @@ import time
 from http.cookies import SimpleCookie
 from urllib.parse import urlencode
 
-from hoshino import aiorequests
-
+from ... import ehttp
 from ..util import Dict, cache, get_config, get_next_day, gh_json, init_db
 from .cookies import Genshin_Cookies
 
@@ -20,7 +19,7 @@ config.runtime = get_next_day()
 db = init_db(config.cache_dir, 'uid.sqlite')
 avatar_db = init_db(config.cache_dir, 'uid.sqlite', tablename='uid_avatars')
 
-@cache(ttl=datetime.timedelta(hours=12))
+@cache(ttl=datetime.timedelta(hours=12), disk=True)
 async def character_list():
     return await gh_json('assets/character.json')
 
@@ -80,13 +79,8 @@ def __get_ds__(query, body=None):
     c = __md5__(((f"salt={n}&t={i}&r={r}&b=" + (body or '') + '&q=') + q))
     return f"{i},{r},{c}"
 
-cookie_info_cache = {}
-
-async def get_cookie_info(cookie):
-    account_id = SimpleCookie(cookie)['account_id'].value
-    if cookie_info_cache.get(account_id):
-        return cookie_info_cache[account_id]
-
+@cache(ttl=datetime.timedelta(days=1), arg_key='account_id', maxsize=1024, disk=True)
+async def request_cookie_info(account_id, cookie):
     url = f'https://api-takumi-record.mihoyo.com/game_record/card/wapi/getGameRecordCard?uid={account_id}'
 
     headers = {
@@ -99,17 +93,25 @@ async def get_cookie_info(cookie):
         'Cookie': cookie,
         'ds': __get_ds__({}, ''),
     }
-    res = await aiorequests.get(url=url, headers=headers, timeout=5)
-    json_data = await res.json(object_hook=Dict)
+    res = await ehttp.get(url, headers=headers, timeout=5)
+    json_data = res.json(object_hook=Dict)
     try:
         info = json_data.data.list[0]
         for info in json_data.data.list:
             if info.game_id == 2:
                 break
     except Exception:
-        info = {}
-    cookie_info_cache[account_id] = info
-    return cookie_info_cache[account_id]
+        # 获取失败的不缓存
+        raise Account_Error('cookie信息获取失败')
+    return info
+
+
+async def get_cookie_info(cookie):
+    account_id = SimpleCookie(cookie)['account_id'].value
+    try:
+        return await request_cookie_info(account_id, cookie)
+    except Account_Error:
+        return {}
 
 last = {'current': 0, 'last': 0, 'all': 0}
 group_use_index = {}
@@ -211,7 +213,7 @@ async def request_data(
     params = {"role_id": uid, "server": server}
 
     json_data = None
-    fn = aiorequests.get
+    fn = ehttp.get
     base_url = 'https://api-takumi-record.mihoyo.com/game_record/app/genshin/api/%s'
     url = base_url % api + '?'
     if api == 'index':
@@ -220,7 +222,7 @@ async def request_data(
         params = {"role_id": uid, "schedule_type": 1, "server": server}
         url += urlencode(params)
     elif api == 'character':
-        fn = aiorequests.post
+        fn = ehttp.post
         json_data = {"character_ids": character_ids}
         json_data.update(params)
         params = {}
@@ -228,8 +230,8 @@ async def request_data(
         url += urlencode(params)
 
     headers['DS'] = __get_ds__(params, json_data and json.dumps(json_data))
-    res = await fn(url=url, headers=headers, json=json_data)
-    json_data = await res.json(object_hook=Dict)
+    res = await fn(url, headers=headers, json=json_data)
+    json_data = res.json(object_hook=Dict)
 
     if json_data.retcode == 10104:
         raise Account_Error('UID[%s]信息获取失败, 请绑定正确的UID' % uid)
@@ -325,13 +327,13 @@ async def request_all_avatar(uid, raw_data, qid, group_id):
     return raw_data
 
 
-@cache(ttl=datetime.timedelta(minutes=30), arg_key='uid')
+@cache(ttl=datetime.timedelta(minutes=30), arg_key='uid', maxsize=512, disk=True)
 async def info(uid, qid=None, group_id=None):
     info_data = await request_data(uid, qid=qid, group_id=group_id)
     return await request_all_avatar(uid, info_data, qid, group_id)
 
 
-@cache(ttl=datetime.timedelta(minutes=30), arg_key='uid')
+@cache(ttl=datetime.timedelta(minutes=30), arg_key='uid', maxsize=512, disk=True)
 async def spiralAbyss(uid, qid=None, group_id=None):
     return await request_data(uid, 'spiralAbyss', qid=qid, group_id=group_id)
 
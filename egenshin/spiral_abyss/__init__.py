@@ -1,5 +1,6 @@
 from requests.exceptions import ConnectionError, ReadTimeout
 from hoshino import Service, priv
+from ... import ehttp
 from hoshino.typing import MessageSegment
 from .query import abyss_use_probability, abyss_use_teams
 from ..player_info.query import get_uid_by_qid, info
@@ -32,7 +33,7 @@ async def main(bot, ev):
     try:
         img = await abyss_use_teams(floor=keyword)
         await bot.send(ev, MessageSegment.image(img), at_sender=True)
-    except (ConnectionError, ReadTimeout) as e:
+    except (ConnectionError, ReadTimeout, ehttp.HTTPError) as e:
         await bot.send(ev, "请求数据失败,请稍后再试", at_sender=True)
         raise e
 
@@ -46,7 +47,7 @@ async def main(bot, ev):
     try:
         img = await abyss_use_probability(floor=keyword)
         await bot.send(ev, MessageSegment.image(img), at_sender=True)
-    except (ConnectionError, ReadTimeout) as e:
+    except (ConnectionError, ReadTimeout, ehttp.HTTPError) as e:
         await bot.send(ev, "请求数据失败,请稍后再试", at_sender=True)
         raise e
 
@@ -70,7 +71,7 @@ async def main(bot, ev):
 
         await bot.send(ev, MessageSegment.image(img), at_sender=True)
 
-    except (ConnectionError, ReadTimeout) as e:
+    except (ConnectionError, ReadTimeout, ehttp.HTTPError) as e:
         await bot.send(ev, "请求数据失败,请稍后再试", at_sender=True)
         raise e
     except Exception as e:
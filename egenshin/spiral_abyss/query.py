@@ -24,7 +24,7 @@ enemies_img = assets_dir / 'spiral_abyss' / 'enemies'
 with open(assets_dir / 'character.json', 'r', encoding="utf-8") as f:
     character: dict = json.loads(f.read(), object_hook=Dict)
 
-@cache(ttl=datetime.timedelta(hours=12))
+@cache(ttl=datetime.timedelta(hours=12), disk=True)
 async def gh_enemies():
     return await gh_json('assets/spiral_abyss/enemies.json')
 
@@ -55,7 +55,10 @@ async def __get_build_id__():
     return data.buildId
 
 
-@cache(ttl=datetime.timedelta(hours=12), arg_key='floor')
+@cache(ttl=datetime.timedelta(hours=12),
+       arg_key='floor',
+       stale_ttl=datetime.timedelta(hours=12),
+       disk=True)
 async def get_abyss_data(floor):
     json_url = f"{BASE_URL}/_next/data/{await __get_build_id__()}/zh/floor-{floor or '12'}.json"
     res = await aiorequests.get(json_url, timeout=10)
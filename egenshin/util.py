@@ -1,4 +1,5 @@
 # -*- coding: UTF-8 -*-
+import asyncio
 import base64
 import datetime
 import functools
@@ -8,16 +9,19 @@ import json
 import os
 import re
 import time
+from collections import OrderedDict
 from io import BytesIO
 from pathlib import Path
 
 import aiofiles
 import yaml
-from hoshino import CanceledException, aiorequests, priv, trigger
+from hoshino import CanceledException, priv, trigger
 from nonebot import *
 from PIL import ImageFont
 from sqlitedict import SqliteDict
 
+from .. import ehttp
+
 bot = get_bot()
 
 try:
@@ -165,41 +169,171 @@ def support_private(sv):
     return wrap
 
 
-def cache(ttl=datetime.timedelta(hours=1), **kwargs):
+class disk_cache:
+    """
+    缓存的磁盘层, 保存在 cache_dir/cache.sqlite, 每个函数一张表
+    第一次用到的时候才打开数据库, 超出 maxsize 后淘汰最旧的数据
+    """
+
+    def __init__(self, name, maxsize=1000):
+        self.name = name
+        self.maxsize = maxsize
+        self._db = None
+
+    @property
+    def db(self) -> SqliteDict:
+        if self._db is None:
+            self._db = SqliteDict(get_path(config.cache_dir, 'cache.sqlite'),
+                                  tablename=self.name,
+                                  encode=json.dumps,
+                                  decode=functools.partial(json.loads,
+                                                           object_hook=Dict),
+                                  autocommit=True)
+        return self._db
+
+    def get(self, key, max_age):
+        data = self.db.get(key)
+        if not data:
+            return None
+        age = time.time() - data.time
+        if age > max_age:
+            del self.db[key]
+            return None
+        return age, data.value
+
+    def set(self, key, value):
+        try:
+            self.db[key] = {'time': time.time(), 'value': value}
+        except (TypeError, ValueError):
+            # 不能json序列化的数据只保存在内存
+            return
+        if len(self.db) > self.maxsize:
+            self.evict()
+
+    def evict(self):
+        # 一次清理到90%, 避免每次写入都要排序
+        items = sorted(self.db.items(), key=lambda x: x[1].time)
+        for key, _ in items[:len(items) - int(self.maxsize * 0.9)]:
+            del self.db[key]
+
+
+def cache(ttl=datetime.timedelta(hours=1),
+          arg_key=None,
+          maxsize=128,
+          stale_ttl=None,
+          disk=False,
+          disk_maxsize=1000,
+          **kwargs):
+    """
+    异步函数结果缓存
+    @param ttl: 缓存有效时间
+    @param arg_key: 只使用这个(或这些)参数生成缓存key, 默认使用全部参数
+    @param maxsize: 最多缓存多少个key, 超出后淘汰最久没使用的
+    @param stale_ttl: 过期后在这段时间内仍然直接返回旧数据, 同时在后台刷新
+    @param disk: 是否同时保存到磁盘, 重启后可以直接使用 (配置 setting.disk_cache 可以全局关闭)
+    @param disk_maxsize: 磁盘最多保存多少个key
+    同一个key同时只会有一个请求在执行, 其他调用等待同一个结果
+    """
+    ttl = ttl.total_seconds()
+    stale_ttl = stale_ttl.total_seconds() if stale_ttl else 0
+    arg_keys = [arg_key] if isinstance(arg_key, str) else arg_key
+
     def wrap(func):
-        cache_data = {}
+        sig = inspect.signature(func)
+        names = list(sig.parameters)
+        defaults = {
+            k: v.default
+            for k, v in sig.parameters.items()
+            if v.default is not inspect.Parameter.empty
+        }
+        # 只有普通参数的函数不需要每次都走 signature.bind
+        simple = all(v.kind == inspect.Parameter.POSITIONAL_OR_KEYWORD
+                     for v in sig.parameters.values())
+        key_names = arg_keys or names
+
+        cache_data = OrderedDict()
+        pending = {}
+        stats = Dict(hits=0, misses=0, stale=0, evictions=0, disk_hits=0)
+        store = None
+        if disk and config.get('setting', {}).get('disk_cache', True):
+            store = disk_cache(f'{func.__module__}.{func.__qualname__}',
+                               disk_maxsize)
+
+        def make_key(args, kw):
+            if simple and len(args) <= len(names):
+                arguments = dict(defaults)
+                arguments.update(zip(names, args))
+                arguments.update(kw)
+            else:
+                bound = sig.bind(*args, **kw)
+                bound.apply_defaults()
+                arguments = bound.arguments
+            return '|'.join([f'{k}_{arguments.get(k)}' for k in key_names])
+
+        def put(key, data):
+            cache_data[key] = data
+            cache_data.move_to_end(key)
+            while len(cache_data) > maxsize:
+                cache_data.popitem(last=False)
+                stats.evictions += 1
+
+        def done(key, fut):
+            pending.pop(key, None)
+            if fut.cancelled() or fut.exception():
+                return
+            put(key, (time.monotonic(), fut.result()))
+            if store:
+                store.set(key, fut.result())
+
+        def load(key, args, kw):
+            fut = pending.get(key)
+            if fut is None:
+                fut = asyncio.ensure_future(func(*args, **kw))
+                pending[key] = fut
+                fut.add_done_callback(functools.partial(done, key))
+            return fut
 
         @functools.wraps(func)
         async def wrapped(*args, **kw):
-            nonlocal cache_data
-            bound = inspect.signature(func).bind(*args, **kw)
-            bound.apply_defaults()
-            ins_key = '|'.join([f'{k}_{v}' for k, v in bound.arguments.items()])
-            default_data = {"time": None, "value": None}
-            data = cache_data.get(ins_key, default_data)
-
-            now = datetime.datetime.now()
-            if not data['time'] or now - data['time'] > ttl:
-                try:
-                    data['value'] = await func(*args, **kw)
-                    data['time'] = now
-                    cache_data[ins_key] = data
-                except Exception as e:
-                    raise e
-
-            return data['value']
-
+            key = make_key(args, kw)
+            data = cache_data.get(key)
+            if not data and store:
+                disk_data = store.get(key, ttl + stale_ttl)
+                if disk_data:
+                    stats.disk_hits += 1
+                    data = (time.monotonic() - disk_data[0], disk_data[1])
+                    put(key, data)
+            if data:
+                age = time.monotonic() - data[0]
+                if age <= ttl:
+                    stats.hits += 1
+                    cache_data.move_to_end(key)
+                    return data[1]
+                if age <= ttl + stale_ttl:
+                    stats.stale += 1
+                    cache_data.move_to_end(key)
+                    load(key, args, kw)
+                    return data[1]
+            stats.misses += 1
+            return await asyncio.shield(load(key, args, kw))
+
+        def cache_info():
+            return Dict(stats, size=len(cache_data), maxsize=maxsize)
+
+        def cache_clear():
+            cache_data.clear()
+            if store:
+                store.db.clear()
+
+        wrapped.cache_info = cache_info
+        wrapped.cache_clear = cache_clear
         return wrapped
 
     return wrap
 
 async def github(path):
-    try:
-        url = f'https://raw.fastgit.org/{path}'
-        res = await aiorequests.get(url, timeout=10)
-        return await res.content
-    except aiorequests.exceptions.ConnectionError:
-        raise
+    url = f'https://raw.fastgit.org/{path}'
+    return await ehttp.get_content(url, timeout=10)
 
 
 gh_end_point = 'pcrbot/erinilis-modules/master/egenshin/'
@@ -236,11 +370,7 @@ async def require_file(file=None,
     if not url:
         raise ValueError('url not null')
 
-    try:
-        res = await aiorequests.get(url, timeout=timeout)
-        content = await res.content
-    except aiorequests.exceptions.ConnectionError:
-        raise
+    content = await ehttp.get_content(url, timeout=timeout)
 
     if file:
         os.makedirs(os.path.dirname(file), exist_ok=True)
@@ -250,17 +380,18 @@ async def require_file(file=None,
     return await read()
 
 
-@cache(ttl=datetime.timedelta(minutes=30), arg_key='url')
+@cache(ttl=datetime.timedelta(minutes=30),
+       arg_key='url',
+       stale_ttl=datetime.timedelta(minutes=30),
+       disk=True)
 async def cache_request_json(url):
-    res = await aiorequests.get(url, timeout=10)
-    return await res.json(object_hook=Dict)
+    return await ehttp.get_json(url, object_hook=Dict, timeout=10)
 
 
 @cache(ttl=datetime.timedelta(hours=24))
 async def get_game_version():
     url = 'https://sdk-static.mihoyo.com/hk4e_cn/mdk/launcher/api/resource?key=eYd89JmJ&launcher_id=18'
-    res = await aiorequests.get(url, timeout=10)
-    json_data = await res.json(object_hook=Dict)
+    json_data = await ehttp.get_json(url, object_hook=Dict, timeout=10)
     if json_data.retcode != 0:
         raise Exception(json_data.message)
     latest = json_data.data.game.latest
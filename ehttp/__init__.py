@@ -0,0 +1,146 @@
+# -*- coding: UTF-8 -*-
+"""
+所有插件共用的异步http客户端
+
+基于 httpx, 长连接复用, 每个域名限制同时请求数, 失败自动重试
+安装了 h2 的情况下会使用 http2
+
+    from .. import ehttp
+    res = await ehttp.get(url)
+    data = res.json()
+"""
+import asyncio
+import os
+import random
+import weakref
+from urllib.parse import urlsplit
+
+import httpx
+import yaml
+
+try:
+    import h2  # noqa: F401
+
+    HAS_HTTP2 = True
+except ImportError:
+    HAS_HTTP2 = False
+
+
+class Dict(dict):
+    __setattr__ = dict.__setitem__
+    __getattr__ = dict.__getitem__
+
+
+# 获取配置
+def get_config():
+    with open(os.path.join(os.path.dirname(__file__), 'config.yml'), 'r', encoding='utf-8') as f:
+        return Dict(yaml.load(f.read(), Loader=yaml.FullLoader))
+
+
+config = get_config()
+
+# 每个事件循环一个客户端 避免跨循环使用连接
+_clients = weakref.WeakKeyDictionary()
+_host_limits = weakref.WeakKeyDictionary()
+
+# 方便插件捕获异常
+HTTPError = httpx.HTTPError
+TransportError = httpx.TransportError
+ConnectError = httpx.ConnectError
+
+# 这些错误说明请求还没发出去 post也可以安全重试
+SAFE_RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def get_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            http2=config.http2 and HAS_HTTP2,
+            follow_redirects=True,
+            timeout=httpx.Timeout(config.timeout, connect=config.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_keepalive_connections,
+                keepalive_expiry=config.keepalive_expiry,
+            ),
+        )
+        _clients[loop] = client
+    return client
+
+
+def host_limit(url) -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    limits = _host_limits.setdefault(loop, {})
+    host = urlsplit(str(url)).netloc
+    if host not in limits:
+        limits[host] = asyncio.Semaphore(config.per_host)
+    return limits[host]
+
+
+def backoff(attempt):
+    base = config.retry_backoff
+    return base * 2 ** attempt + random.uniform(0, base)
+
+
+async def request(method, url, *, retries=None, **kw) -> httpx.Response:
+    """
+    发送请求, 参数和 httpx.AsyncClient.request 一致
+    @param retries: 重试次数, 默认使用配置中的 retries
+    """
+    retries = config.retries if retries is None else retries
+    idempotent = method.upper() in ('GET', 'HEAD', 'OPTIONS')
+    client = get_client()
+    async with host_limit(url):
+        for attempt in range(retries + 1):
+            try:
+                res = await client.request(method, url, **kw)
+            except httpx.TransportError as e:
+                if attempt == retries or not (idempotent or isinstance(e, SAFE_RETRY_ERRORS)):
+                    raise
+            else:
+                if attempt == retries or not idempotent or res.status_code not in config.retry_status:
+                    return res
+                await res.aclose()
+            await asyncio.sleep(backoff(attempt))
+
+
+async def get(url, **kw) -> httpx.Response:
+    return await request('GET', url, **kw)
+
+
+async def post(url, **kw) -> httpx.Response:
+    return await request('POST', url, **kw)
+
+
+async def get_json(url, object_hook=None, **kw):
+    res = await get(url, **kw)
+    return res.json(object_hook=object_hook)
+
+
+async def get_content(url, **kw) -> bytes:
+    res = await get(url, **kw)
+    return res.content
+
+
+async def download(url, file, chunk_size=65536, **kw):
+    """
+    边下载边写到文件 不把整个内容读进内存
+    @return: 下载的字节数
+    """
+    size = 0
+    async with host_limit(url):
+        async with get_client().stream('GET', url, **kw) as res:
+            res.raise_for_status()
+            with open(file, 'wb') as f:
+                async for chunk in res.aiter_bytes(chunk_size):
+                    f.write(chunk)
+                    size += len(chunk)
+    return size
+
+
+async def close():
+    for client in list(_clients.values()):
+        await client.aclose()
+    _clients.clear()
@@ -0,0 +1,106 @@
+# -*- coding: UTF-8 -*-
+"""
+插件启动时需要的初始化任务 (获取在线数据等)
+
+不在import的时候执行, 等bot启动后在后台一起运行, 单个任务失败或者超时不会拖慢启动
+
+    from ..ehttp import startup
+
+    @startup.warmup('eclanrank.line')
+    async def _():
+        ...
+
+    startup.is_ready('eclanrank.line')
+"""
+import asyncio
+import time
+
+import nonebot
+from nonebot.log import logger
+
+
+class Dict(dict):
+    __setattr__ = dict.__setitem__
+    __getattr__ = dict.__getitem__
+
+
+tasks = {}
+started = False
+
+
+def warmup(name, timeout=60):
+    """
+    注册一个启动任务
+    @param name: 任务名 用于查询状态
+    @param timeout: 超时时间 单位秒
+    """
+
+    def wrap(func):
+        tasks[name] = Dict(func=func, timeout=timeout, ready=False, error=None, cost=None, future=None)
+        # bot已经启动了的话直接运行
+        if started:
+            run(name)
+        return func
+
+    return wrap
+
+
+def run(name):
+    task = tasks[name]
+    task.future = asyncio.ensure_future(run_task(task))
+    return task.future
+
+
+async def run_task(task):
+    start = time.monotonic()
+    try:
+        await asyncio.wait_for(task.func(), task.timeout)
+        task.ready = True
+    except Exception as e:
+        task.error = repr(e) or type(e).__name__
+    finally:
+        task.cost = time.monotonic() - start
+
+
+def is_ready(name):
+    task = tasks.get(name)
+    return bool(task and task.ready)
+
+
+async def wait_ready(name, timeout=None):
+    task = tasks.get(name)
+    if not task or not task.future:
+        return False
+    try:
+        await asyncio.wait_for(asyncio.shield(task.future), timeout)
+    except asyncio.TimeoutError:
+        pass
+    return task.ready
+
+
+def report():
+    msg = []
+    for name, task in tasks.items():
+        if task.ready:
+            state = '完成'
+        elif task.error:
+            state = f'失败 {task.error}'
+        else:
+            state = '运行中'
+        cost = '' if task.cost is None else ' %.2fs' % task.cost
+        msg.append(f'{name}: {state}{cost}')
+    return '\n'.join(msg)
+
+
+async def run_all():
+    start = time.monotonic()
+    await asyncio.gather(*[run(name) for name in list(tasks)])
+    logger.info('启动任务完成, 共%.2fs\n%s' % (time.monotonic() - start, report()))
+
+
+@nonebot.on_startup
+async def _():
+    global started
+    started = True
+    # 不等待 bot先启动
+    asyncio.ensure_future(run_all())
@@ -7,10 +7,11 @@
 基于 nonebot 问答
 """
 import re
+import copy
 import random
-from pathlib import Path
 from nonebot import *
 from . import util
+from .store import qa_db, qa_store
 
 from hoshino import Service  # 如果使用hoshino的分群管理取消注释这行
 
@@ -18,14 +19,28 @@ from hoshino import Service  # 如果使用hoshino的分群管理取消注释这
 sv = Service('eqa')  # 如果使用hoshino的分群管理取消注释这行
 
 config = util.get_config()
-db = util.init_db(config['cache_dir'], tablename='unnamed')
-reg_db = util.init_db(config['cache_dir'], tablename='reg')
+# 问答读进内存 修改时同时写回数据库
+sql_db = qa_db(util.get_path(config['cache_dir'], 'db.sqlite'))
+db = qa_store(sql_db)
+reg_db = qa_store(sql_db, is_reg=True)
+# 正则问题编译好放在内存里
+reg_index = util.reg_index(reg_db.keys())
 
 _bot = get_bot()
 
 admins = config['admins']
 admins = set((admins if isinstance(admins, list) else [admins]) + _bot.config.SUPERUSERS)
 
+# 命令按这个顺序匹配
+trigger = util.command_trigger([(name, config['comm'][name]) for name in [
+    'show_question_list',  # 显示全部设置的问题
+    'show_question',  # 显示设置的问题
+    'answer_delete',
+    'answer_delete_all',
+    'answer_all',
+    'answer_me',
+]])
+
 
 @sv.on_message('group')  # 如果使用hoshino的分群管理取消注释这行 并注释下一行的 @_bot.on_message("group")
 async def eqa_main(*params):
@@ -33,37 +48,28 @@ async def eqa_main(*params):
 
     msg = str(ctx['message']).strip()
 
-    # 显示全部设置的问题
-    show_target = util.get_msg_keyword(config['comm']['show_question_list'], msg, True)
-    if isinstance(show_target, str):
-        return await bot.send(ctx, await show_question(ctx, show_target, True))
+    for comm, keyword in trigger.iter_match(msg):
+        # 显示全部设置的问题
+        if comm == 'show_question_list':
+            return await bot.send(ctx, await show_question(ctx, keyword, True))
 
-    # 显示设置的问题
-    show_target = util.get_msg_keyword(config['comm']['show_question'], msg, True)
-    if isinstance(show_target, str):
-        return await bot.send(ctx, await show_question(ctx, show_target))
+        # 显示设置的问题
+        if comm == 'show_question':
+            return await bot.send(ctx, await show_question(ctx, keyword))
 
-    if del_target := util.get_msg_keyword(
-        config['comm']['answer_delete'], msg, True
-    ):
-        return await bot.send(ctx, await del_question(ctx, del_target))
+        if not keyword:
+            continue
 
-    if del_all := util.get_msg_keyword(
-        config['comm']['answer_delete_all'], msg, True
-    ):
-        return await bot.send(ctx, await del_question(ctx, del_all, True))
+        if comm == 'answer_delete':
+            return await bot.send(ctx, await del_question(ctx, keyword))
 
-    if keyword := util.get_msg_keyword(
-        config['comm']['answer_all'], msg, True
-    ):
-        msg = await ask(ctx, keyword, False)
-        if msg:
-            return await bot.send(ctx, msg)
+        if comm == 'answer_delete_all':
+            return await bot.send(ctx, await del_question(ctx, keyword, True))
 
-    if keyword := util.get_msg_keyword(config['comm']['answer_me'], msg, True):
-        msg = await ask(ctx, keyword, True)
-        if msg:
-            return await bot.send(ctx, msg)
+        if comm in ['answer_all', 'answer_me']:
+            res = await ask(ctx, keyword, comm == 'answer_me')
+            if res:
+                return await bot.send(ctx, res)
 
     # 回复消息
     ans = await answer(ctx)
@@ -110,8 +116,8 @@ async def ask(ctx, keyword, is_me):
                 _once = True
                 ms = MessageSegment.text(reg[0])
         if ms['type'] == 'image':
-            ms = util.ms_handler_image(ms, config['rule']['use_cq_code_image_url'], config['cache_dir'],
-                                       b64=config['image_base64'])
+            ms = await util.ms_handler_image(ms, config['rule']['use_cq_code_image_url'], config['cache_dir'],
+                                             b64=config['image_base64'])
             if not ms:
                 return '图片缓存失败了啦！'
         message.append(ms)
@@ -131,32 +137,20 @@ async def ask(ctx, keyword, is_me):
     else:
         _db = db  # 否则使用普通的数据库
 
-    qus_list = _db.get(qus, [])
-    qus_list.append({
+    _db.add({
         'user_id': ctx['user_id'],
         'group_id': ctx['group_id'],
         'is_me': is_me,
         'qus': qus,
         'message': message
     })
-    _db[qus] = qus_list
+    if _db is reg_db:
+        reg_index.add(qus)
     return '我学会啦 来问问我吧！'
 
 
 # 回复的函数
-async def answer(ctx, _reg_flag=False):
-    msg = util.get_message_str(ctx['message']).strip()
-    ans_list = db.get(msg, [])
-    _is_reg = False
-    if not ans_list or _reg_flag:
-        msg = str(ctx['message']).strip()
-        reg_msg = util.get_message_str(msg, True)
-        reg_list = list(filter(None, map(lambda x: re.search(x, reg_msg) and reg_db[x] or None, reg_db.keys())))
-        if not reg_list:
-            return False
-        ans_list = sum(reg_list, [])
-        _is_reg = True
-
+async def answer(ctx):
     group_id = ctx['group_id']
     user_id = ctx['user_id']
     super_admin_is_all_group = config['rule']['super_admin_is_all_group']
@@ -165,12 +159,19 @@ async def answer(ctx, _reg_flag=False):
 
     # 获取到当前群的列表 判断是否来自该群 或者是否是超级管理员
     # 超级管理员设置的是否为所有群问答
-    ans_list = util.filter_list(ans_list, lambda x: group_id == x['group_id'] or (
-        x['user_id'] in admins if super_admin_is_all_group else False))
+    all_group_users = admins if super_admin_is_all_group else ()
 
-    # 木有在这群
+    msg = util.get_message_str(ctx['message']).strip()
+    ans_list = db.find(msg, group_id, all_group_users)
+    _is_reg = False
+    # 木有在这群 再试试正则
     if not ans_list:
-        return False if _reg_flag else await answer(ctx, True)
+        msg = str(ctx['message']).strip()
+        reg_msg = util.get_message_str(msg, True)
+        ans_list = sum((reg_db.find(x, group_id, all_group_users) for x in reg_index.search(reg_msg)), [])
+        if not ans_list:
+            return False
+        _is_reg = True
     # 是否优先自己的回答 是的话则选择自己的列表
     if priority_self_answer:
         self_list = util.filter_list(ans_list, lambda x: user_id == x['user_id'])
@@ -188,6 +189,9 @@ async def answer(ctx, _reg_flag=False):
     if ans['is_me'] and ans['user_id'] != user_id:
         return False
 
+    # 内存里的回答不能改 复制一份再处理
+    ans = dict(ans, message=copy.deepcopy(ans['message']))
+
     ans_msg = ans['message']
     _msg = ans_msg[0]
     if (
@@ -209,12 +213,9 @@ async def answer(ctx, _reg_flag=False):
         ans['message'] = util.message_image2base64(ans['message'])
 
     for value in ans['message']:
-        if value['type'] == 'image':
+        if value['type'] == 'image' and not value['data']['file'].startswith('base64://'):
             # 处理一下绝对路径问题
-            img_path = Path(value['data']['file'])
-            img_name = img_path.stem + img_path.suffix
-            new_path = Path(__file__).parent / config['cache_dir'] / 'img' / img_name
-            value['data']['file'] = f'file:///{str(new_path)}'
+            value['data']['file'] = util.image_file_path(value['data']['file'])
 
     # 最后就是把验证成功的消息返回去
     return ans_msg
@@ -223,11 +224,12 @@ async def answer(ctx, _reg_flag=False):
 # 显示问题的函数
 async def show_question(ctx, target, show_all=False):
     print_all_split = config['str']['print_all_split'] or " | "
-
-    db_list = list(db.values()) + list(reg_db.values())
+    page_size = config.get('show_question_page_size', 50)
+    page = util.get_page(target)
+    total_page = 1
 
     # 获取当前群设置的问题列表
-    ans_list = util.get_current_ans_list(ctx, db_list)
+    ans_list = db.group_lists(ctx['group_id']) + reg_db.group_lists(ctx['group_id'])
 
     if not show_all:
         # 如果只显示个人
@@ -263,34 +265,42 @@ async def show_question(ctx, target, show_all=False):
                 ans_list, lambda x: True in [i['is_me'] for i in x]
             )
 
-            ans_list = sum(
-                (util.get_all_ans_list_by_qq(q, db_list) for q in admins),
+            qq_list = sum(
+                (db.user_lists(q) + reg_db.user_lists(q) for q in admins),
                 all_list,
             )
 
         elif qq in admins:
-            ans_list = util.get_all_ans_list_by_qq(qq, db_list)
+            qq_list = db.user_lists(qq) + reg_db.user_lists(qq)
         else:
-            ans_list = util.get_all_ans_list_by_qq(qq, ans_list)
+            qq_list = util.get_all_ans_list_by_qq(qq, ans_list)
 
         # 如果是多个人 那就加个名字区别一下
         if is_at:
             name = await util.get_group_member_name(ctx['group_id'], qq)
             head = f'{name} :\n'
 
-        str_list = util.get_qus_str_by_list(ans_list)
+        # 先排序分页 只转换这一页的问题
+        str_list, total = util.paginate(sorted(util.get_qus_str_by_list(qq_list)), page, page_size)
+        total_page = max(total_page, total)
         str_list = await util.cq_msg2str(str_list, group_id=ctx['group_id'])
-        str_list = sorted(str_list)
         # 把问题都打印出来
         msg_context = f'全体问答:\n{print_all_split.join(str_list)}' if show_all else "\n".join(str_list)
 
         priority_msg = ''
         if show_all:
-            pri_str_list = util.get_qus_str_by_list(priority_list)
+            pri_str_list, total = util.paginate(sorted(util.get_qus_str_by_list(priority_list)), page, page_size)
+            total_page = max(total_page, total)
             pri_str_list = await util.cq_msg2str(pri_str_list, group_id=ctx['group_id'])
             priority_msg = "\n个人问答:\n" + print_all_split.join(pri_str_list)
 
-        msg = f"{msg}{head}{msg_context if ans_list else '还没有设置过问题呢'}{priority_msg}\n"
+        msg = f"{msg}{head}{msg_context if qq_list else '还没有设置过问题呢'}{priority_msg}\n"
+
+    if total_page > 1:
+        msg += f'第{max(page, 1)}/{total_page}页 在命令后面加上页数翻页'
+
+    if config.get('show_question_image', False) and (image := await util.text2image(msg.strip())):
+        return image
     return msg
 
 
@@ -305,7 +315,7 @@ async def del_question(ctx, target, clear=False):
     else:
         _db = db  # 否则使用普通的数据库
 
-    ans_list = _db.get(target, [])
+    ans_list = list(_db.get(target))
     if not ans_list:
         return '没这个问题哦'
 
@@ -317,15 +327,17 @@ async def del_question(ctx, target, clear=False):
         if not is_super_admin:
             return '木有权限啦~~'
 
-        util.delete_message_image_file(ans_list)
-        _db.pop(target)
+        _db.clear(target)
+        util.delete_message_image_file(ans_list, sql_db.image_is_used)
+        if _db is reg_db:
+            reg_index.remove(target)
         return '清空成功~'
     if config['rule']['question_del_last']:
         ans_list.reverse()
 
     is_del_flag = False
 
-    for index, value in enumerate(ans_list):
+    for value in ans_list:
         # 如果不是本群就跳过  或者 是超级管理员的话 就继续删除
         if value['group_id'] != ctx['group_id'] and (
             not is_super_admin or value['user_id'] not in admins
@@ -339,23 +351,17 @@ async def del_question(ctx, target, clear=False):
                 or is_super_admin
             ):
                 is_del_flag = True
-                util.delete_message_image_file(value)
-                ans_list.pop(index)
+                _db.remove(value)
+                util.delete_message_image_file(value, sql_db.image_is_used)
                 break
         elif value['user_id'] == ctx['user_id']:
             is_del_flag = True
-            util.delete_message_image_file(value)
-            ans_list.pop(index)
+            _db.remove(value)
+            util.delete_message_image_file(value, sql_db.image_is_used)
             break
 
-    # 表示删除了元素 可以更新数据库了
-    if is_del_flag:
-        # 如果刚刚反转了 那要反转回来
-        if config['rule']['question_del_last']:
-            ans_list.reverse()
-        if bool(ans_list):
-            _db[target] = ans_list
-        else:
-            _db.pop(target)
+    # 问题没有回答了 正则也不用留着了
+    if is_del_flag and _db is reg_db and target not in reg_db:
+        reg_index.remove(target)
 
     return '删除成功啦' if is_del_flag else '删除失败 可能木有权限'
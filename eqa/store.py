@@ -0,0 +1,198 @@
+# -*- coding: UTF-8 -*-
+import sqlite3
+import json
+import os
+
+# 数据库结构的版本 存在 PRAGMA user_version 里
+# 0: 旧版 sqlitedict 的 unnamed(普通问题) reg(正则问题) 两张表, 每个问题一行存整个回答列表的json
+# 1: questions answers images 三张表, images 只存图片文件名 (内容的md5) 目录移动过的同一张图片也能对上
+SCHEMA_VERSION = 1
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    qus TEXT NOT NULL,
+    is_reg INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (is_reg, qus)
+);
+CREATE TABLE IF NOT EXISTS answers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    question_id INTEGER NOT NULL REFERENCES questions (id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL,
+    group_id INTEGER NOT NULL,
+    is_me INTEGER NOT NULL DEFAULT 0,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS answers_question ON answers (question_id);
+CREATE INDEX IF NOT EXISTS answers_group ON answers (group_id, question_id);
+CREATE INDEX IF NOT EXISTS answers_user ON answers (user_id);
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    answer_id INTEGER NOT NULL REFERENCES answers (id) ON DELETE CASCADE,
+    file TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_answer ON images (answer_id);
+CREATE INDEX IF NOT EXISTS images_file ON images (file);
+'''
+
+
+# 图片的引用按文件名算 路径可能因为目录移动而不同
+def image_key(file):
+    return os.path.basename(file)
+
+
+# 回答里的图片文件
+def get_message_images(message):
+    return [image_key(x['data']['file'] or x['data'].get('url')) for x in message if x['type'] == 'image']
+
+
+# 问答数据库
+class qa_db:
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA foreign_keys = ON')
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+        if self.conn.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+            self.migrate()
+
+    # 把旧版sqlitedict的数据导进来 只执行一次 旧的表保留不动
+    def migrate(self):
+        tables = {x for x, in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        with self.conn:
+            for table, is_reg in [('unnamed', False), ('reg', True)]:
+                if table not in tables:
+                    continue
+                for qus, value in self.conn.execute(f'SELECT key, value FROM "{table}" ORDER BY rowid').fetchall():
+                    for ans in json.loads(value):
+                        self.__insert(dict(ans, qus=qus), is_reg)
+            self.conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def load(self, is_reg=False):
+        res = {}
+        rows = self.conn.execute('''
+            SELECT a.id, q.qus, a.user_id, a.group_id, a.is_me, a.message
+            FROM answers a JOIN questions q ON a.question_id = q.id
+            WHERE q.is_reg = ? ORDER BY q.id, a.id''', (int(is_reg),))
+        for _id, qus, user_id, group_id, is_me, message in rows:
+            res.setdefault(qus, []).append({
+                'id': _id,
+                'user_id': user_id,
+                'group_id': group_id,
+                'is_me': bool(is_me),
+                'qus': qus,
+                'message': json.loads(message)
+            })
+        return res
+
+    def __insert(self, ans, is_reg):
+        self.conn.execute('INSERT OR IGNORE INTO questions (qus, is_reg) VALUES (?, ?)', (ans['qus'], int(is_reg)))
+        question_id, = self.conn.execute('SELECT id FROM questions WHERE qus = ? AND is_reg = ?',
+                                         (ans['qus'], int(is_reg))).fetchone()
+        cur = self.conn.execute('INSERT INTO answers (question_id, user_id, group_id, is_me, message) '
+                                'VALUES (?, ?, ?, ?, ?)',
+                                (question_id, ans['user_id'], ans['group_id'], int(ans['is_me']),
+                                 json.dumps(ans['message'])))
+        self.conn.executemany('INSERT INTO images (answer_id, file) VALUES (?, ?)',
+                              [(cur.lastrowid, x) for x in get_message_images(ans['message'])])
+        return cur.lastrowid
+
+    def insert(self, ans, is_reg=False):
+        with self.conn:
+            return self.__insert(ans, is_reg)
+
+    def delete(self, answer_id):
+        with self.conn:
+            row = self.conn.execute('SELECT question_id FROM answers WHERE id = ?', (answer_id,)).fetchone()
+            if not row:
+                return
+            self.conn.execute('DELETE FROM answers WHERE id = ?', (answer_id,))
+            # 没有回答的问题也删掉
+            self.conn.execute('DELETE FROM questions WHERE id = ? AND NOT EXISTS '
+                              '(SELECT 1 FROM answers WHERE question_id = ?)', (row[0], row[0]))
+
+    def delete_question(self, qus, is_reg=False):
+        with self.conn:
+            self.conn.execute('DELETE FROM questions WHERE qus = ? AND is_reg = ?', (qus, int(is_reg)))
+
+    # 图片还有没有回答在用
+    def image_is_used(self, file):
+        return bool(self.conn.execute('SELECT 1 FROM images WHERE file = ? LIMIT 1',
+                                      (image_key(file),)).fetchone())
+
+
+# 问答的内存索引 启动时从数据库读一次, 之后的读取都在内存里, 修改会同时写回数据库
+# questions: {问题: [回答, ...]}
+# groups: {群号: {问题: [回答, ...]}}  users: {QQ: {问题: [回答, ...]}}
+class qa_store:
+    def __init__(self, db: qa_db, is_reg=False):
+        self.db = db
+        self.is_reg = is_reg
+        self.questions = db.load(is_reg)
+        self.groups = {}
+        self.users = {}
+        for qus, ans_list in self.questions.items():
+            for ans in ans_list:
+                self.__index(qus, ans)
+
+    def __index(self, qus, ans):
+        self.groups.setdefault(ans['group_id'], {}).setdefault(qus, []).append(ans)
+        self.users.setdefault(ans['user_id'], {}).setdefault(qus, []).append(ans)
+
+    def __unindex(self, qus, ans):
+        for index, key in [(self.groups, ans['group_id']), (self.users, ans['user_id'])]:
+            qus_dict = index.get(key, {})
+            ans_list = [x for x in qus_dict.get(qus, []) if x is not ans]
+            if ans_list:
+                qus_dict[qus] = ans_list
+            else:
+                qus_dict.pop(qus, None)
+            if not qus_dict:
+                index.pop(key, None)
+
+    def __contains__(self, qus):
+        return qus in self.questions
+
+    def keys(self):
+        return self.questions.keys()
+
+    def get(self, qus):
+        return self.questions.get(qus, [])
+
+    # 当前群能用的回答 all_group_users 里的人设置的回答所有群都能用
+    def find(self, qus, group_id, all_group_users=()):
+        if not any(qus in self.users.get(x, {}) for x in all_group_users):
+            return list(self.groups.get(group_id, {}).get(qus, []))
+        return [x for x in self.get(qus) if x['group_id'] == group_id or x['user_id'] in all_group_users]
+
+    # 群里有回答的问题列表
+    def group_lists(self, group_id):
+        return [self.questions[x] for x in self.groups.get(group_id, {})]
+
+    # 这个人设置过的问题列表
+    def user_lists(self, user_id):
+        return [self.questions[x] for x in self.users.get(user_id, {})]
+
+    def add(self, ans):
+        # 跟存到数据库里的保持一致
+        ans = json.loads(json.dumps(ans))
+        ans['id'] = self.db.insert(ans, self.is_reg)
+        qus = ans['qus']
+        self.questions.setdefault(qus, []).append(ans)
+        self.__index(qus, ans)
+        return ans
+
+    def remove(self, ans):
+        qus = ans['qus']
+        self.db.delete(ans['id'])
+        self.__unindex(qus, ans)
+        ans_list = [x for x in self.get(qus) if x is not ans]
+        if ans_list:
+            self.questions[qus] = ans_list
+        else:
+            self.questions.pop(qus, None)
+
+    def clear(self, qus):
+        self.db.delete_question(qus, self.is_reg)
+        for ans in self.questions.pop(qus, []):
+            self.__unindex(qus, ans)
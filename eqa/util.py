@@ -1,16 +1,24 @@
 # -*- coding: UTF-8 -*-
 from typing import List, Set
-from sqlitedict import SqliteDict
 from nonebot import *
+from collections import deque, OrderedDict
+from .. import ehttp
+import functools
+import asyncio
+import time
+import hashlib
 import base64
-import requests
 import imghdr
-import uuid
+import sys
 import yaml
-import json
 import os
 import re
 
+try:
+    import re._parser as sre_parse
+except ImportError:
+    import sre_parse
+
 bot = get_bot()
 
 
@@ -26,7 +34,7 @@ config = get_config()
 # 获取字符串中的关键字  is_first为true返回后面 false返回 前面和后面
 def get_msg_keyword(keyword, msg, is_first=False):
     try:
-        res = re.split(format_reg(keyword, is_first), msg, 1)
+        res = compile_reg(keyword, is_first).split(msg, 1)
         res = tuple(res[::-1]) if len(res) == 2 else False
     except TypeError:
         return False
@@ -39,17 +47,164 @@ def format_reg(keyword, is_first=False):
     return f"{'|'.join([f'^{i}' for i in keyword] if is_first else keyword)}"
 
 
-def get_path(*paths):
-    return os.path.join(os.path.dirname(__file__), *paths)
+# 编译后的配置正则 同样的配置只编译一次
+def compile_reg(keyword, is_first=False):
+    keyword = tuple(keyword) if isinstance(keyword, list) else keyword
+    return __compile_reg__(keyword, is_first)
+
+
+@functools.lru_cache(maxsize=256)
+def __compile_reg__(keyword, is_first):
+    keyword = list(keyword) if isinstance(keyword, tuple) else keyword
+    return re.compile(format_reg(keyword, is_first))
+
+
+# 所有命令前缀合并成一个正则 一次匹配就知道是哪个命令
+# 前面的命令优先, 命令后面的内容为空等情况需要继续匹配的话 用 iter_match 依次获取后面匹配的命令
+class command_trigger:
+    def __init__(self, comm):
+        """
+        @param comm: [(命令名, 配置的前缀), ...] 按匹配的优先顺序
+        """
+        self.names = [name for name, _ in comm]
+        self.regs = [compile_reg(keyword, True) for _, keyword in comm]
+        self.reg = re.compile('|'.join([
+            f'(?P<c{index}>{format_reg(keyword, True)})'
+            for index, (_, keyword) in enumerate(comm)
+        ]))
+
+    def iter_match(self, msg):
+        match = self.reg.match(msg)
+        if not match:
+            return
+        first = next(i for i in range(len(self.names)) if match.group(f'c{i}') is not None)
+        yield self.names[first], msg[match.end():]
+        for index in range(first + 1, len(self.names)):
+            if match := self.regs[index].match(msg):
+                yield self.names[index], msg[match.end():]
+
+
+# 多关键字匹配 (Aho-Corasick) 一次扫描就找出消息里出现了哪些关键字
+class keyword_matcher:
+    def __init__(self, words):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for word in words:
+            state = 0
+            for char in word:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.out[state].append(word)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[nxt] = self.goto[fail].get(char, 0)
+                self.out[nxt] += self.out[self.fail[nxt]]
+
+    def find(self, text):
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            found.update(self.out[state])
+        return found
+
+
+# 找出正则里一定会出现的最长的一段文字 没有就返回空
+def reg_required_literal(pattern):
+    try:
+        tree = sre_parse.parse(pattern)
+    except (re.error, TypeError):
+        return ''
+    state = getattr(tree, 'state', None) or tree.pattern
+    if state.flags & re.IGNORECASE:
+        return ''
+
+    runs = []
+
+    def walk(items):
+        run = ''
+        for op, av in items:
+            if op is sre_parse.LITERAL:
+                run += chr(av)
+                continue
+            runs.append(run)
+            run = ''
+            if op is sre_parse.SUBPATTERN and not av[1] & re.IGNORECASE:
+                walk(av[-1])
+            elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] >= 1:
+                walk(av[2])
+        runs.append(run)
+
+    walk(tree)
+    return max(runs, key=len)
+
+
+# 正则问题的索引 问题编译一次常驻内存
+# 先用关键字匹配筛出消息里包含必需文字的正则, 再逐个匹配, 没有必需文字的正则每次都匹配
+class reg_index:
+    def __init__(self, patterns=()):
+        self.patterns = {}  # 正则: (顺序, 编译后的正则)
+        self.always = set()
+        self.literals = {}  # 必需文字: {正则}
+        self.__seq = 0
+        self.__matcher = None
+        for pattern in patterns:
+            self.add(pattern)
+
+    def add(self, pattern):
+        if pattern in self.patterns:
+            return True
+        try:
+            compiled = re.compile(pattern)
+        except re.error:
+            return False
+        self.__seq += 1
+        self.patterns[pattern] = (self.__seq, compiled)
+        if literal := reg_required_literal(pattern):
+            self.literals.setdefault(literal, set()).add(pattern)
+            self.__matcher = None
+        else:
+            self.always.add(pattern)
+        return True
+
+    def remove(self, pattern):
+        if self.patterns.pop(pattern, None) is None:
+            return
+        self.always.discard(pattern)
+        literal = reg_required_literal(pattern)
+        if pattern in self.literals.get(literal, ()):
+            self.literals[literal].discard(pattern)
+            if not self.literals[literal]:
+                self.literals.pop(literal)
+                self.__matcher = None
+
+    # 返回匹配到的正则 按设置的顺序
+    def search(self, msg):
+        if self.__matcher is None:
+            self.__matcher = keyword_matcher(self.literals.keys())
+        candidates = set(self.always)
+        for literal in self.__matcher.find(msg):
+            candidates |= self.literals[literal]
+        candidates = sorted((self.patterns[x][0], x) for x in candidates)
+        return [x for _, x in candidates if self.patterns[x][1].search(msg)]
 
 
-# 初始化数据库
-def init_db(db_dir, db_name='db.sqlite', tablename=''):
-    return SqliteDict(get_path(db_dir, db_name),
-                      tablename=tablename,
-                      encode=json.dumps,
-                      decode=json.loads,
-                      autocommit=True)
+def get_path(*paths):
+    return os.path.join(os.path.dirname(__file__), *paths)
 
 
 # 寻找MessageSegment里的某个关键字的位置
@@ -66,23 +221,32 @@ def find_ms_str_index(ms, keyword, is_first=False):
 
 
 # 下载图片到本地 并返回message图片类型
-def ms_handler_image(ms, msg_diy=False, cache_dir='', dir_name='img', b64=False):
+async def ms_handler_image(ms, msg_diy=False, cache_dir='', dir_name='img', b64=False):
     url = str(ms['data']['url'] if ms['data'].get('url') else ms['data']['file']).strip()
     if not url:
         return False
     if msg_diy and url[0] == '?':
         return MessageSegment.image(url[1:])
     try:
-        pic = requests.get(url, timeout=30)
-    except requests.exceptions.ConnectionError:
+        res = await ehttp.get(url, timeout=30)
+    except ehttp.HTTPError:
         return False
-    base64_suffix = '.base64' if b64 else ''
-    file_name = get_path(cache_dir, dir_name, f'{uuid.uuid1().hex}.{imghdr.what(None, pic.content)}{base64_suffix}')
-    with open(file_name, 'wb') as fp:
-        content = bytes(pic2b64(pic.content), encoding="utf8") if b64 else pic.content
-        fp.write(content)
+    if res.status_code != 200:
+        return False
+    file_name = save_image(res.content, cache_dir, dir_name, b64)
     protocol = '' if b64 else 'file:///'
-    return MessageSegment.image(f'{protocol}{os.path.abspath(file_name)}')
+    return MessageSegment.image(f'{protocol}{file_name}')
+
+
+# 图片用内容的md5做文件名 同样的图片只存一份
+def save_image(pic, cache_dir='', dir_name='img', b64=False):
+    base64_suffix = '.base64' if b64 else ''
+    file_name = f'{hashlib.md5(pic).hexdigest()}.{imghdr.what(None, pic)}{base64_suffix}'
+    file_name = os.path.abspath(get_path(cache_dir, dir_name, file_name))
+    if not os.path.exists(file_name):
+        with open(file_name, 'wb') as fp:
+            fp.write(bytes(pic2b64(pic), encoding="utf8") if b64 else pic)
+    return file_name
 
 
 # 是否是群管理员
@@ -94,16 +258,34 @@ def filter_list(plist, func):
     return list(filter(func, plist))
 
 
+# 群成员的名字 {群号: (获取时间, {QQ: 名字})}
+member_names = {}
+member_locks = {}
+
+
+# 获取整个群的群友名字 一个群只请求一次成员列表 缓存 member_name_cache_time 秒
+async def get_group_member_names(group_id):
+    cache_time = config.get('member_name_cache_time', 300)
+    lock = member_locks.setdefault(group_id, asyncio.Lock())
+    async with lock:
+        cached = member_names.get(group_id)
+        if cached and time.time() - cached[0] < cache_time:
+            return cached[1]
+        member_list = await bot.get_group_member_list(group_id=group_id)
+        names = {x['user_id']: x['card'] or x['nickname'] for x in member_list}
+        member_names[group_id] = (time.time(), names)
+        return names
+
+
 # 获取群内的群友名字
 async def get_group_member_name(group_id, user_id):
+    names = await get_group_member_names(group_id)
+    if user_id in names:
+        return names[user_id]
+    # 刚进群的还不在列表里
     qq_info = await bot.get_group_member_info(group_id=group_id, user_id=user_id)
-    return qq_info['card'] or qq_info['nickname']
-
-
-# 获取当前群设置的问题列表
-def get_current_ans_list(ctx, ans_list):
-    return filter_list(ans_list,
-                       lambda x: (x[0]['group_id'] if isinstance(x, list) else x['group_id']) == ctx['group_id'])
+    names[user_id] = qq_info['card'] or qq_info['nickname']
+    return names[user_id]
 
 
 def get_all_ans_list_by_qq(qq, ans_list):
@@ -115,6 +297,31 @@ def get_qus_str_by_list(ans_list):
     return {i[0]['qus'] for i in ans_list}
 
 
+# 消息最后的数字作为页数 没有就是第一页
+def get_page(msg):
+    page = re.search(r'(\d+)\s*$', re.sub(r'\[CQ:[^]]+]', '', msg))
+    return int(page[1]) if page else 1
+
+
+# 分页 返回 (这一页的列表, 总页数)
+def paginate(items, page=1, size=50):
+    page = max(page, 1)
+    return items[(page - 1) * size:page * size], max((len(items) + size - 1) // size, 1)
+
+
+# 文字转图片 使用egenshin的 text_image 没有启用egenshin插件或者出错的话返回False
+async def text2image(text):
+    # 只在egenshin已经加载的时候使用 不然导入会把egenshin的功能也注册上
+    if __package__.rsplit('.', 1)[0] + '.egenshin' not in sys.modules:
+        return False
+    try:
+        from ..egenshin.imghandler import text_image
+        return MessageSegment.image(await text_image(text))
+    except Exception as e:
+        print(e)
+        return False
+
+
 def pic2b64(pic) -> str:
     return f'base64://{base64.b64encode(pic).decode()}'
 
@@ -123,20 +330,58 @@ def get_file_suffix(file_name: str) -> str:
     return os.path.splitext(file_name)[-1]
 
 
+# base64图片的内存缓存 超过总大小时淘汰最久没用的 文件修改过就重新读
+class base64_cache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.data = OrderedDict()  # 文件: (修改时间, base64内容)
+
+    def get(self, file):
+        mtime = os.stat(file).st_mtime_ns
+        if (cached := self.data.get(file)) and cached[0] == mtime:
+            self.data.move_to_end(file)
+            return cached[1]
+        with open(file, encoding='utf8') as f:
+            content = f.read()
+        self.pop(file)
+        if len(content) <= self.max_size:
+            self.data[file] = (mtime, content)
+            self.size += len(content)
+            while self.size > self.max_size:
+                _, (_, old) = self.data.popitem(last=False)
+                self.size -= len(old)
+        return content
+
+    def pop(self, file):
+        if cached := self.data.pop(file, None):
+            self.size -= len(cached[1])
+
+
+b64_cache = base64_cache(int(config.get('image_base64_cache_size', 64) * 1024 * 1024))
+
+
 def message_image2base64(message):
     for index, value in enumerate(message):
         if value['type'] == 'image':
             url = value['data']['file'] or value['data']['url']
             if get_file_suffix(url) == '.base64':
                 try:
-                    with open(url, encoding='utf8') as f:
-                        message[index] = MessageSegment.image(f.read())
+                    message[index] = MessageSegment.image(b64_cache.get(url))
                 except FileNotFoundError:
                     print(f'设置的图片丢失。。{url}')
     return message
 
 
-def delete_message_image_file(message):
+# 图片放在缓存目录里 用现在的目录拼一下绝对路径
+@functools.lru_cache(maxsize=1024)
+def image_file_path(file):
+    img_name = os.path.basename(file)
+    return f"file:///{os.path.abspath(get_path(config['cache_dir'], 'img', img_name))}"
+
+
+# 删除回答里的图片 is_used(图片) 为真的说明还有别的回答在用 不删除
+def delete_message_image_file(message, is_used=None):
     message = message if isinstance(message, list) else [message]
     for value in message:
         # 首先取出message里的图片链接
@@ -146,13 +391,20 @@ def delete_message_image_file(message):
                 value['message'], lambda x: x['type'] == 'image'
             )
         ]
-        # 如果包含file协议就删除
-        urls = [i[8:] if 'file:///' in i else i for i in urls]
-        # 直接删除
-        try:
-            ok = [os.remove(i) for i in urls]
-        except FileNotFoundError as e:
-            print(e)
+        # is_used 按文件名(内容的md5)判断 路径不同的同一张图片也算在用
+        if is_used:
+            urls = [i for i in urls if not is_used(i)]
+        for i in urls:
+            if i.startswith(('http://', 'https://')):
+                continue
+            b64_cache.pop(i)
+            # 目录移动过的话 存的路径已经不对了 用现在的缓存目录删除
+            path = image_file_path(i)[8:]
+            b64_cache.pop(path)
+            try:
+                os.remove(path)
+            except FileNotFoundError as e:
+                print(e)
 
 
 # 获取消息中字符串 处理md5值
@@ -186,17 +438,18 @@ def get_message_str(message, is_reg=False):
 # 把cq码转换成字符串
 async def cq_msg2str(msg: List[str] or Set[str], group_id=None):
     msg = list(msg) if isinstance(msg, set) else msg
-    for index, value in enumerate(msg):
+    if not group_id:
+        return msg
+
+    async def to_str(value):
         at = re.match('\[CQ:at,qq=(\d+)', value)
-        if at and group_id:
-            qq = int(at[1])
-            try:
-                name = await get_group_member_name(group_id, qq)
-                msg[index] = f'@{name}'
-            except:
-                # name = await bot.get_stranger_info(user_id=qq)
-                # name = name["nickname"]
-                # name = qq
-                # name = ''
-                msg.pop(index)
-    return msg
+        if not at:
+            return value
+        try:
+            return f'@{await get_group_member_name(group_id, int(at[1]))}'
+        except:
+            # 不在群里的就不显示了
+            return None
+
+    msg = await asyncio.gather(*[to_str(x) for x in msg])
+    return [x for x in msg if x is not None]
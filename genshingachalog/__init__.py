@@ -1,8 +1,10 @@
 import re
+from contextlib import aclosing
 from nonebot import *
-from hoshino import Service, aiorequests
+from hoshino import Service
 from .service import switcher
 from . import util, gacha_log
+from .gacha_import import iter_gacha_json
 from .bind import bind
 from ..egenshin.util import support_private
 
@@ -74,6 +76,7 @@ async def gacha_statistics(ctx):
 
     await _bot.send(ctx, f'{msg}正在处理 请稍等')
     await _bot.send(ctx, await log.update_xlsx(is_expired), at_sender=True)
+    await _bot.send(ctx, log.statistics(), at_sender=True)
 
 
 @sv.on_notice('group_upload')
@@ -86,32 +89,30 @@ async def main(session: NoticeSession):
         return
 
     await session.send('检测到卡池记录文件.正在导入数据', at_sender=True)
-    if file['size'] > 5242880:
+    if file['size'] > config.get('upload_max_size', 50) * 1048576:
         await session.send('档案过大,确保正确的文件,后请联系作者修改限制', at_sender=True)
         return
 
-    res = await aiorequests.get(file['url'], timeout=30)
-    json_data = await res.json(object_hook=util.Dict)
-
-    gacha_data = sum(json_data.result, [])
-    keys = ['time', 'name', 'item_type', 'rank_type']
-    raw_data = list(
-        map(lambda x: list(reversed([dict(zip(keys, i)) for i in x])),
-            gacha_data[1::2]))
-
-    gacha_data = dict(zip(gacha_data[::2], raw_data))
-
-    if log_db := db.get(uid, {}):
-        lg = gacha_log.gacha_log(uid, log_db['authkey'], log_db.get('region'))
-        try:
-            count = await lg.merge_gacha_json(json_data.uid, gacha_data)
-            await session.send(f'合并成功~ 一共导入了{count}条数据', at_sender=True)
-        except Exception as e:
-            await session.send(e.args[0], at_sender=True)
+    # 没绑定过的也可以导入 之后再绑定
+    log_db = db.get(uid, {})
+    lg = gacha_log.gacha_log(uid, log_db.get('authkey', ''), log_db.get('region'))
+    inserted, skipped = 0, 0
+    gacha_uid = ''
+    try:
+        # 一个卡池一个卡池的写进数据库
+        # 出错的时候也马上关掉 删除临时文件
+        async with aclosing(iter_gacha_json(file['url'])) as banners:
+            async for gacha_uid, gacha_type, records in banners:
+                i, s = await lg.merge_gacha_banner(gacha_uid, gacha_type, records)
+                inserted += i
+                skipped += s
+    except Exception as e:
+        await session.send(f'导入失败: {e.args[0] if e.args else e}', at_sender=True)
+        return
 
+    if log_db:
+        await session.send(f'合并成功~ 一共导入了{inserted}条数据, 跳过了{skipped}条已有的数据', at_sender=True)
     else:
-        region = 'cn_qd01' if json_data.uid[0] == "5" else 'cn_gf01'
-        gacha_data = {'authkey': "", 'region': region}
-        gacha_data |= gacha_data
-        db[uid] = gacha_data
-        await session.send('导入成功~', at_sender=True)
+        region = 'cn_qd01' if gacha_uid[:1] == "5" else 'cn_gf01'
+        db[uid] = {'authkey': "", 'region': region}
+        await session.send(f'导入成功~ 一共导入了{inserted}条数据', at_sender=True)
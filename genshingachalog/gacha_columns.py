@@ -0,0 +1,116 @@
+# -*- coding: UTF-8 -*-
+"""
+卡池记录在内存里的列式结构
+
+一个卡池的记录按时间从旧到新存成几个数组, 同样的物品名字只存一次, 保存到数据库见 gacha_store
+    ids    int64   记录id (导入的记录没有id 为0)
+    times  int64   时间 (服务器的时间当成UTC存的秒数)
+    types  uint16  卡池类型 (限定池有301和400)
+    ranks  uint8   星级
+    items  uint32  物品在 names 里的位置
+"""
+import datetime
+from array import array
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def parse_time(time_str):
+    return int(datetime.datetime.fromisoformat(time_str).replace(tzinfo=datetime.timezone.utc).timestamp())
+
+
+def format_time(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).strftime(TIME_FORMAT)
+
+
+def count_keys(pairs):
+    seen = {}
+    for pair in pairs:
+        seen[pair] = seen.get(pair, -1) + 1
+        yield (*pair, seen[pair])
+
+
+class gacha_columns:
+    def __init__(self, gacha_type=0, uid=''):
+        self.gacha_type = int(gacha_type)
+        self.uid = uid
+        self.ids = array('q')
+        self.times = array('q')
+        self.types = array('H')
+        self.ranks = array('B')
+        self.items = array('I')
+        self.names = []  # [(名字, 类型)]
+        self.__names = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    # 最新一条记录的id 没有就是None
+    @property
+    def last_id(self):
+        return self.ids[-1] or None if self.ids else None
+
+    def intern(self, name, item_type):
+        key = (name, item_type)
+        index = self.__names.get(key)
+        if index is None:
+            index = self.__names[key] = len(self.names)
+            self.names.append(key)
+        return index
+
+    def name(self, index):
+        return self.names[self.items[index]][0]
+
+    def add(self, _id, timestamp, gacha_type, rank, name, item_type):
+        self.ids.append(_id)
+        self.times.append(timestamp)
+        self.types.append(gacha_type)
+        self.ranks.append(rank)
+        self.items.append(self.intern(name, item_type))
+
+    def append(self, row):
+        self.add(int(row.get('id') or 0),
+                 parse_time(row['time']),
+                 int(row.get('gacha_type') or self.gacha_type),
+                 int(row['rank_type']),
+                 row['name'],
+                 row.get('item_type', ''))
+        if not self.uid and row.get('uid'):
+            self.uid = str(row['uid'])
+
+    # rows 按时间从旧到新
+    def extend_rows(self, rows):
+        for row in rows:
+            self.append(row)
+
+    # rows 和接口返回的一样 从新到旧
+    @classmethod
+    def from_rows(cls, rows, gacha_type=0):
+        cols = cls(gacha_type)
+        cols.extend_rows(reversed(rows))
+        return cols
+
+    def row(self, index):
+        name, item_type = self.names[self.items[index]]
+        row = {
+            'uid': self.uid,
+            'gacha_type': str(self.types[index]),
+            'item_id': '',
+            'count': '1',
+            'time': format_time(self.times[index]),
+            'name': name,
+            'lang': 'zh-cn',
+            'item_type': item_type,
+            'rank_type': str(self.ranks[index]),
+        }
+        if self.ids[index]:
+            row['id'] = str(self.ids[index])
+        return row
+
+    # 每条记录的 (时间, 名字, 同一秒内同名的第几个) 用来判断导入的记录是否已经存在
+    def merge_keys(self):
+        return count_keys(zip(self.times, map(self.name, range(len(self)))))
+
+    # 转换回原来的格式 从新到旧
+    def to_rows(self):
+        return [self.row(i) for i in range(len(self) - 1, -1, -1)]
@@ -0,0 +1,65 @@
+# -*- coding: UTF-8 -*-
+"""
+导入群文件上传的卡池记录 gacha-list-{uid}.json
+
+    {"uid": "...", "result": [["301", [[时间, 名字, 类型, 星级], ...]], ...]}
+
+先下载到临时文件, 再一个卡池一个卡池的解析交给调用的地方保存
+安装了 ijson 的话边读文件边解析 不会把整个文件读进内存, 没有的话一次解析整个文件
+解析都在线程里 不会卡住bot
+"""
+import asyncio
+import json
+import os
+import tempfile
+
+from .. import ehttp
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+KEYS = ['time', 'name', 'item_type', 'rank_type']
+
+
+def read_uid(path):
+    with open(path, 'rb') as f:
+        return next(ijson.items(f, 'uid'), None)
+
+
+def iter_result(path):
+    with open(path, 'rb') as f:
+        yield from ijson.items(f, 'result.item')
+
+
+def load_json(path):
+    with open(path, 'rb') as f:
+        data = json.load(f)
+    return data.get('uid'), iter(data.get('result', []))
+
+
+async def iter_gacha_json(url):
+    """
+    一个卡池一个卡池的返回 (uid, 卡池, 记录)
+    记录和文件里一样从旧到新 [{'time', 'name', 'item_type', 'rank_type'}, ...]
+    """
+    loop = asyncio.get_running_loop()
+    fd, path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    banners = None
+    try:
+        await ehttp.download(url, path, timeout=60)
+        if ijson:
+            uid = await loop.run_in_executor(None, read_uid, path)
+            banners = iter_result(path)
+        else:
+            uid, banners = await loop.run_in_executor(None, load_json, path)
+
+        while item := await loop.run_in_executor(None, next, banners, None):
+            gacha_type, records = item
+            yield str(uid), str(gacha_type), [dict(zip(KEYS, map(str, x))) for x in records]
+    finally:
+        if hasattr(banners, 'close'):
+            banners.close()
+        os.remove(path)
@@ -1,22 +1,26 @@
 import asyncio
 import base64
-import json
-import math
 import re
+import time
 import urllib.parse
 from enum import Enum
 from io import BytesIO
 
 import matplotlib.pyplot as plt
-import requests
-from hoshino import aiorequests
 from nonebot import MessageSegment
 
+from .. import ehttp
+from ..ehttp import startup
 from . import util
+from .gacha_columns import gacha_columns, count_keys, parse_time
+from .gacha_stats import get_statistics
+from .gacha_store import gacha_store
 from .xlsx_handler import write_xlsx
 
 config = util.get_config()
 db = util.init_db(config.cache_dir)
+# 卡池记录 一条记录一行
+store = gacha_store(util.get_path(config.cache_dir, 'gacha_records.sqlite'))
 
 
 class GACHA_TYPE(Enum):
@@ -35,12 +39,42 @@ def gacha_type_by_name(name):
     return 0
 
 
-def get_item_list():
-    url = 'https://webstatic.mihoyo.com/hk4e/gacha_info/cn_gf01/items/zh-cn.json'
-    return util.dict_to_object(json.loads(requests.get(url, timeout=30).text))
+items = []
+
+
+# 读取卡池记录
+def load_logs(qq, gacha_type) -> gacha_columns:
+    cols = store.load(qq, gacha_type)
+    if cols:
+        return cols
+    # 以前直接存在用户数据里的记录 转换过来
+    cols = gacha_columns.from_rows(db.get(qq, {}).get(str(gacha_type), []), gacha_type)
+    if cols:
+        store.insert(qq, cols)
+    user = db.get(qq, {})
+    if str(gacha_type) in user:
+        user.pop(str(gacha_type))
+        db[qq] = user
+    return cols
+
 
+# 保存从 start 开始的新记录 返回新增的条数
+def save_logs(qq, cols: gacha_columns, start=0):
+    return store.insert(qq, cols, start)
 
-items = get_item_list()
+# authkey 是否有效 {qq: (authkey, 检查的时间, 是否有效)}  authkey_cache_time 秒内不重复检查
+authkey_status = {}
+
+# 翻页的请求间隔 按 (qq, 卡池) 分开计算
+limiter = util.rate_limiter()
+
+
+@startup.warmup('genshingachalog.items')
+async def get_item_list():
+    url = 'https://webstatic.mihoyo.com/hk4e/gacha_info/cn_gf01/items/zh-cn.json'
+    res = await ehttp.get(url, timeout=30)
+    items[:] = res.json(object_hook=util.Dict)
+    return items
 
 
 class gacha_log:
@@ -72,68 +106,98 @@ class gacha_log:
         if end_id:
             params['end_id'] = end_id
         url = f'{config.api}{service}?{urllib.parse.urlencode(params)}'
-        res = await aiorequests.get(url, timeout=30)
-        res = util.dict_to_object(json.loads(await res.text))
+        for _ in range(3):
+            await limiter.wait((self.qq, gacha_type))
+            res = await ehttp.get(url, timeout=30)
+            res = res.json(object_hook=util.Dict)
+            # visit too frequently
+            if res.retcode != -110:
+                limiter.success()
+                break
+            limiter.slow_down()
         if res.message == 'authkey valid error':
             print('authkey 错误')
+            authkey_status[self.qq] = (self.authkey, time.time(), False)
             return False
         if not res.data:
             print(res.message)
             return False
         return res.data
 
-    async def get_logs(self, gacha_type, _filter=None, history=None, req_history=True):
+    # 只获取比历史记录新的数据, 历史记录最新一条的id就是上次记录到的位置, 翻到这个id就停止
+    # 最新一条是导入的没有id的话 翻到比它早的时间就停止, 同一秒的按 (时间, 名字, 第几个) 去掉已有的
+    # 新的数据加到历史记录后面返回, 请求失败返回原来的历史记录
+    async def get_logs(self, gacha_type, history: gacha_columns = None) -> gacha_columns:
+        if history is None:
+            history = load_logs(self.qq, gacha_type)
+        last_id = history.last_id
+        last_time = history.times[-1] if history else 0
+
         item_list = []
-        _flag = False
         end_id = 0
-        add_history = False
-        if not history:
-            history = db[self.qq].get(str(gacha_type), [])
-
-        history_player_uid = await self.get_player_uid(history)
         for page in range(1, 9999):
-            if add_history:
-                break
-            if end_id == -1:
-                break
-            await asyncio.sleep(0.3)
-            clist = (await self.get_api(page=page, gacha_type=gacha_type, end_id=end_id)).list or \
-                    (req_history and history)
+            data = await self.get_api(page=page, gacha_type=gacha_type, end_id=end_id)
+            if not data:
+                # 中间断了的话 新数据和历史记录之间会缺一段 宁可不要
+                return history
+            clist = data.list
             if not clist:
                 break
 
-            player_uid = await self.get_player_uid(clist)
-            if history_player_uid != player_uid:  # 如果 历史记录不匹配 则不使用之前的记录
-                history = None
+            # 如果 历史记录不匹配 则不使用之前的记录
+            if history.uid and history.uid != clist[0].get('uid'):
+                history, last_id, last_time = gacha_columns(gacha_type), None, 0
 
-            end_id = clist[-1].get('id', -1)
-            for data in clist:
-                if not _filter and history and history[0].get('id') == data.get('id'):
-                    item_list = item_list + history
-                    add_history = True
+            found = False
+            for item in clist:
+                if last_id and int(item.get('id') or 0) == last_id:
+                    found = True
                     break
-                item_list.append(data)
-                if _filter:
-                    _flag = _filter(data)
-                    if _flag:
-                        break
-            if _flag:
+                if not last_id and last_time and parse_time(item['time']) < last_time:
+                    found = True
+                    break
+                item_list.append(item)
+            if found or len(clist) < self.size:
                 break
-        return item_list
+            end_id = clist[-1].get('id')
+
+        item_list.reverse()
+        if not last_id and last_time:
+            # 和导入的记录在同一秒的 已经有了就跳过
+            exists = {x for x in history.merge_keys() if x[0] == last_time}
+            keys = count_keys((parse_time(x['time']), x['name']) for x in item_list)
+            item_list = [x for key, x in zip(keys, item_list) if key not in exists]
+        # 没找到上次的位置的话 历史记录都是更早的了 一样接在后面
+        history.extend_rows(item_list)
+        return history
+
+    # 更新卡池记录并保存
+    async def update_logs(self, gacha_type) -> gacha_columns:
+        history = load_logs(self.qq, gacha_type)
+        count = len(history)
+        logs = await self.get_logs(gacha_type, history)
+        # 只写入新的记录 换了uid的话是新的记录
+        if save_logs(self.qq, logs, count if logs is history else 0):
+            # 按时间重新读出来 保证顺序
+            logs = store.load(self.qq, gacha_type, logs.uid)
+        return logs
 
     async def last5star(self, gacha_type):
-        item_list = await self.get_logs(gacha_type, lambda item_info: int(item_info['rank_type']) == 5,
-                                        req_history=False)
-        return (
-            f"距离上一个{item_list[-1:][0]['name']}一共抽了{len(item_list) - 1}发"
-            if item_list
-            else '还没有抽过'
-        )
+        logs = await self.update_logs(gacha_type)
+        if not logs:
+            return '还没有抽过'
+        for index in range(len(logs) - 1, -1, -1):
+            if logs.ranks[index] == 5:
+                return f"距离上一个{logs.name(index)}一共抽了{len(logs) - 1 - index}发"
+        return f'还没有抽到5星, 一共抽了{len(logs)}发'
 
     async def current(self):
-        activity_gacha = await self.last5star(GACHA_TYPE.activity.value)
-        weapon_gacha = await self.last5star(GACHA_TYPE.weapon.value)
-        permanent_gacha = await self.last5star(GACHA_TYPE.permanent.value)
+        # 三个卡池同时查
+        activity_gacha, weapon_gacha, permanent_gacha = await asyncio.gather(
+            self.last5star(GACHA_TYPE.activity.value),
+            self.last5star(GACHA_TYPE.weapon.value),
+            self.last5star(GACHA_TYPE.permanent.value),
+        )
 
         msg = '查询的记录有1小时左右的延迟\n\n'
         msg += '限定池%s\n' % activity_gacha
@@ -147,7 +211,13 @@ class gacha_log:
         return data.gacha_type_list if data else False
 
     async def check_authkey(self):
-        return bool(await self.get_config_list())
+        status = authkey_status.get(self.qq)
+        if status and status[0] == self.authkey and time.time() - status[1] < config.get('authkey_cache_time', 300):
+            return status[2]
+        # 只记录有效的, 无效的在 get_api 里确认是authkey错误才记录 网络问题不算
+        if valid := bool(await self.get_config_list()):
+            authkey_status[self.qq] = (self.authkey, time.time(), True)
+        return valid
 
     async def get_player_info(self):
         params = {
@@ -164,12 +234,12 @@ class gacha_log:
             'game_biz': 'hk4e_cn',
         }
         url = f'https://api-takumi.mihoyo.com/common/im/userClient/initUserChat?{urllib.parse.urlencode(params)}'
-        res = await aiorequests.post(url, json={
+        res = await ehttp.post(url, json={
             "device": 'Mozilla',
             "language": 'zh-cn',
             "system_info": 'Mozilla/5.0 (Windows NT 10.0; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.198 Safari/537.36'
         }, timeout=30)
-        res = util.dict_to_object(json.loads(await res.text))
+        res = res.json(object_hook=util.Dict)
         data = res.get('data')
         return data or None
 
@@ -183,86 +253,70 @@ class gacha_log:
         return self.history_player_uid
 
     async def update_xlsx(self, is_expired_authkey=False):
-        user = db.get(self.qq, {})
-        logs = None
+        logs = {}
         if is_expired_authkey:
             # 如果凭证过期的话 直接从数据库拿缓存
-            logs = user.get(str(GACHA_TYPE.activity.value))
-            if not logs:
+            for gacha_type in GACHA_TYPE:
+                logs[gacha_type.value] = load_logs(self.qq, gacha_type.value)
+            if not logs[GACHA_TYPE.activity.value]:
                 return '你尚未获取过卡池记录,请重新绑定刷新数据'
         else:
             for gacha_type in GACHA_TYPE:
-                gacha_type = gacha_type.value
-                data = await self.get_logs(gacha_type, history=user.get(str(gacha_type), []))
-                user[str(gacha_type)] = data
-                if not logs:
-                    logs = data
-            db[self.qq] = user
-
-        player_uid = await self.get_player_uid(logs)
-        await write_xlsx(user)
+                logs[gacha_type.value] = await self.update_logs(gacha_type.value)
+
+        player_uid = logs[GACHA_TYPE.activity.value].uid or await self.get_player_uid()
+        await write_xlsx({str(k): v.to_rows() for k, v in logs.items()})
         msg = '缓存数据' if is_expired_authkey else '数据已更新'
         urls = '\n'.join([f'{url}?uid={player_uid}' for url in config.gacha_analyzer_webs])
         return f'{msg}, 请访问: \n{urls}'
 
-    async def merge_gacha_json(self, gacha_data_uid, gacha_data):
-        user = db.get(self.qq, {})
-        count = 0
-        user_uid = None
-        for gacha_type in gacha_data:
-            data = gacha_data[gacha_type]
-            user_gacha = user.get(gacha_type)
-            if not user_uid:
-                user_uid = await self.get_player_uid(user_gacha)
-                if gacha_data_uid != user_uid:
-                    raise Exception(f'UID与导入的卡池记录不符 上传的UID:{gacha_data_uid} 服务器UID:{user_uid}')
-            # 如果没有卡池数据 则直接增加
-            if not user_gacha:
-                user[gacha_type] = data
-                count += len(data)
-            else:
-                data_index = 0
-                for index, item in enumerate(user_gacha):
-                    if item['time'] == data[data_index]['time'] and item['name'] == data[data_index]['name']:
-                        # 如果已经存在的话 则直接跳出 说明已经存在数据了
-                        data_index += 1
-                        if index + 1 == len(user_gacha) and data_index < len(data):
-                            # 说明已经到底了 没更多数据了 ,直接拼接剩下的数据
-                            update_data = data[data_index:]
-                            count += len(update_data)
-                            user_gacha += update_data
-                        continue
-
-                # 更新原有数据
-                user[gacha_type] = user_gacha
-        # 最后更新进数据库
-        db[self.qq] = user
-        return count
+    # 合并导入的一个卡池的记录 data 从旧到新
+    # 按 (时间, 名字, 同一秒内同名的第几个) 判断是否已经有这条记录
+    # 顺序乱的或者只有部分重叠的都可以 返回 (新增的条数, 跳过的条数)
+    async def merge_gacha_banner(self, gacha_data_uid, gacha_type, data):
+        history = load_logs(self.qq, gacha_type)
+        if history.uid and history.uid != str(gacha_data_uid):
+            raise Exception(f'UID与导入的卡池记录不符 上传的UID:{gacha_data_uid} 服务器UID:{history.uid}')
+        exists = set(history.merge_keys())
+
+        keys = count_keys((parse_time(x['time']), x['name']) for x in data)
+        new = gacha_columns(gacha_type, history.uid or str(gacha_data_uid))
+        skipped = 0
+        for key, row in zip(keys, data):
+            if key in exists:
+                skipped += 1
+                continue
+            new.append(row)
+        return save_logs(self.qq, new), skipped
+
+    # 三个卡池的统计 用保存的记录 不重新请求
+    def statistics(self):
+        permanent = config.get('permanent_5star') or []
+        msg = []
+        for gacha_type, name in ((GACHA_TYPE.activity, '限定池'), (GACHA_TYPE.weapon, '武器池'),
+                                 (GACHA_TYPE.permanent, '常规池')):
+            stats = get_statistics(self.qq, load_logs(self.qq, gacha_type.value), permanent)
+            if not stats['total']:
+                continue
+            text = (f"{name} 一共{stats['total']}抽 "
+                    f"5星{stats['count5']}个({stats['rate5']:.2%}) 4星{stats['count4']}个({stats['rate4']:.2%})\n"
+                    f"平均{stats['avg5']:.1f}抽出5星, 已垫{stats['current5']}抽 期望再抽{stats['expected']:.1f}抽出5星")
+            if stats['win'] + stats['lose']:
+                text += f"\n小保底 {stats['win']}胜{stats['lose']}负({stats['win_rate']:.0%})"
+            msg.append(text)
+        return '\n\n'.join(msg) or '还没有卡池记录'
 
     # 暂时弃用 直接使用网页版本的
     async def gacha_statistics(self, uid, gacha_type_name):
         gacha_type = gacha_type_by_name(gacha_type_name)
         if not gacha_type:
             return
-        user = db.get(uid, {})
-        logs = await self.get_logs(gacha_type, history=user.get(str(gacha_type), []))
-        user[str(gacha_type)] = logs
-        db[uid] = user
-        # logs = user.get(str(gacha_type)) # debug
-        data = list(map(lambda x: x if x['rank_type'] == '5' else 0, logs))
-        input_values = []
-        squares = []
-        pulls = 0
-        data.reverse()
-        for item in data:
-            pulls += 1
-            if not item:
-                continue
-            squares.append(pulls)
-            input_values.append(f"{item['name']}({pulls})")
-            pulls = 0
+        logs = load_logs(uid, gacha_type)
+        stats = get_statistics(uid, logs, config.get('permanent_5star') or [])
+        pulls = stats['current5']
+        input_values = [f'{name}({x})' for name, x in zip(stats['names5'], stats['pity5'])]
         input_values.append(f"{'目前'}({pulls})")
-        squares.append(pulls)
+        squares = stats['pity5'] + [pulls]
 
         plt.rcParams['font.sans-serif'] = ['SimHei']
         plt.rcParams['axes.unicode_minus'] = False
@@ -286,19 +340,7 @@ class gacha_log:
                 )
                 plt.title('%s(%s次5星出货概率为%.2f%%)' % (gacha_type_name, all_pulls_num, total_probability), fontsize=24)
 
-                max_pulls = 74
-                if gacha_type == GACHA_TYPE.weapon.value:
-                    max_pulls -= 10
-
-                probability = 0.6
-
-                if pulls > max_pulls:
-                    probability += (pulls - max_pulls) * 5.3
-                    probability_str = "当前%s抽,下一抽大概有%.2f%%几率获得5星" % (pulls, probability)
-                else:
-                    mp = max_pulls - pulls
-                    probability_str = '%s抽前抽%s次有%.2f%%几率出现5星' % (
-                        max_pulls, mp, round((1 - math.pow(0.994, mp)) * 100, 2))
+                probability_str = '当前%s抽,期望再抽%.1f次出现5星' % (pulls, stats['expected'])
                 plt.xlabel(probability_str, fontsize=14)
             else:
                 plt.title(f'前一组记录({index})', fontsize=24)
@@ -0,0 +1,158 @@
+# -*- coding: UTF-8 -*-
+"""
+卡池记录统计 直接用 gacha_columns 里的数组计算
+
+    pity5 / pity4   每个5星/4星是垫了多少抽出的
+    current5        距离上一个5星已经抽了多少
+    rate5 / rate4   出货率
+    win / lose      限定池5星的小保底 歪了的下一个5星是大保底不算
+    histogram       5星出货抽数的分布 每10抽一组
+    expected        按软保底的概率 期望还要多少抽出5星
+
+安装了 numpy 的话用 numpy 计算, 没有的话用python循环算 结果一样
+同一个用户的统计结果会缓存 有新的记录才重新计算
+"""
+from .gacha_columns import gacha_columns
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 卡池类型: (基础概率, 第几抽开始概率增加, 每抽增加的概率, 保底抽数)
+PITY_RULES = {
+    301: (0.006, 74, 0.06, 90),
+    200: (0.006, 74, 0.06, 90),
+    302: (0.007, 63, 0.07, 80),
+}
+
+# 算小保底的卡池
+FEATURED_TYPES = (301, 302)
+
+# {(qq, 卡池): (记录的标识, 统计结果)}
+cache = {}
+
+
+def pity_rule(gacha_type):
+    return PITY_RULES.get(int(gacha_type), PITY_RULES[200])
+
+
+# 第 1..保底 抽出5星的概率
+def pull_probability(gacha_type):
+    base, soft, step, hard = pity_rule(gacha_type)
+    if np is not None:
+        pulls = np.arange(1, hard + 1)
+        return np.clip(base + np.maximum(pulls - soft + 1, 0) * step, 0, 1)
+    return [min(base + max(n - soft + 1, 0) * step, 1) for n in range(1, hard + 1)]
+
+
+# 已经垫了 pulls 抽 期望还要多少抽出5星
+def expected_pulls(gacha_type, pulls):
+    prob = pull_probability(gacha_type)
+    pulls = min(pulls, len(prob) - 1)
+    if np is not None:
+        # 第 k 抽还没出的概率是前面每一抽都没出的乘积
+        survive = np.cumprod(1 - prob[pulls:-1])
+        return float(1 + survive.sum())
+    expected, survive = 1, 1
+    for p in prob[pulls:-1]:
+        survive *= 1 - p
+        expected += survive
+    return expected
+
+
+def _ratio(a, b):
+    return a / b if b else 0
+
+
+def _stats_numpy(cols: gacha_columns, permanent):
+    ranks = np.frombuffer(cols.ranks, dtype=np.uint8)
+    hard = pity_rule(cols.gacha_type)[3]
+
+    idx5 = np.flatnonzero(ranks == 5)
+    idx4 = np.flatnonzero(ranks == 4)
+    pity5 = np.diff(idx5, prepend=-1)
+    pity4 = np.diff(idx4, prepend=-1)
+    current5 = len(ranks) - 1 - int(idx5[-1]) if len(idx5) else len(ranks)
+
+    histogram = np.bincount(np.clip(pity5 - 1, 0, hard - 1) // 10, minlength=-(-hard // 10))
+
+    # 5星是不是常驻的 歪了的下一个是大保底
+    names5 = [cols.name(i) for i in idx5]
+    lose = np.array([x in permanent for x in names5], dtype=bool)
+    guaranteed = np.zeros_like(lose)
+    guaranteed[1:] = lose[:-1]
+    chance = ~guaranteed
+    return {
+        'names5': names5,
+        'pity5': pity5.tolist(),
+        'pity4': pity4.tolist(),
+        'current5': current5,
+        'histogram': histogram.tolist(),
+        'avg5': float(pity5.mean()) if len(pity5) else 0,
+        'lose': int(lose[chance].sum()),
+        'win': int((chance & ~lose).sum()),
+    }
+
+
+def _stats_python(cols: gacha_columns, permanent):
+    ranks = cols.ranks
+    hard = pity_rule(cols.gacha_type)[3]
+
+    idx5 = [i for i, x in enumerate(ranks) if x == 5]
+    idx4 = [i for i, x in enumerate(ranks) if x == 4]
+    pity5 = [b - a for a, b in zip([-1] + idx5, idx5)]
+    pity4 = [b - a for a, b in zip([-1] + idx4, idx4)]
+    current5 = len(ranks) - 1 - idx5[-1] if idx5 else len(ranks)
+
+    histogram = [0] * -(-hard // 10)
+    for x in pity5:
+        histogram[min(max(x - 1, 0), hard - 1) // 10] += 1
+
+    names5 = [cols.name(i) for i in idx5]
+    win, lose, guaranteed = 0, 0, False
+    for name in names5:
+        is_lose = name in permanent
+        if not guaranteed:
+            if is_lose:
+                lose += 1
+            else:
+                win += 1
+        guaranteed = is_lose
+    return {
+        'names5': names5,
+        'pity5': pity5,
+        'pity4': pity4,
+        'current5': current5,
+        'histogram': histogram,
+        'avg5': sum(pity5) / len(pity5) if pity5 else 0,
+        'lose': lose,
+        'win': win,
+    }
+
+
+def statistics(cols: gacha_columns, permanent=()):
+    permanent = set(permanent)
+    stats = (_stats_numpy if np is not None else _stats_python)(cols, permanent)
+    total = len(cols)
+    stats['total'] = total
+    stats['count5'] = len(stats['pity5'])
+    stats['count4'] = len(stats['pity4'])
+    stats['rate5'] = _ratio(stats['count5'], total)
+    stats['rate4'] = _ratio(stats['count4'], total)
+    if cols.gacha_type not in FEATURED_TYPES:
+        stats['win'] = stats['lose'] = 0
+    stats['win_rate'] = _ratio(stats['win'], stats['win'] + stats['lose'])
+    stats['expected'] = expected_pulls(cols.gacha_type, stats['current5'])
+    return stats
+
+
+# 有新的记录才重新计算
+def get_statistics(qq, cols: gacha_columns, permanent=()):
+    key = (qq, cols.gacha_type)
+    mark = (cols.uid, len(cols), cols.times[-1] if cols else 0, cols.last_id)
+    if (hit := cache.get(key)) and hit[0] == mark:
+        return hit[1]
+    stats = statistics(cols, permanent)
+    cache[key] = (mark, stats)
+    return stats
@@ -0,0 +1,81 @@
+# -*- coding: UTF-8 -*-
+import sqlite3
+
+from .gacha_columns import gacha_columns
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS gacha_records (
+    qq INTEGER NOT NULL,
+    uid TEXT NOT NULL,
+    gacha_type INTEGER NOT NULL,
+    id INTEGER NOT NULL,
+    time INTEGER NOT NULL,
+    real_type INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    item_type TEXT NOT NULL,
+    rank_type INTEGER NOT NULL,
+    PRIMARY KEY (qq, uid, gacha_type, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS gacha_records_time ON gacha_records (qq, gacha_type, time);
+'''
+
+# 导入的记录没有id, 用 时间*100+同一秒内没用过的序号 当作id, 服务器的id都比这个大
+FAKE_ID_MAX = 10 ** 12
+
+
+def fake_id(timestamp, ordinal):
+    return timestamp * 100 + ordinal
+
+
+# 卡池记录数据库 一条抽卡记录一行, 重复的记录由主键去重
+class gacha_store:
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+
+    # 最近抽卡的uid
+    def last_uid(self, qq, gacha_type):
+        row = self.conn.execute('SELECT uid FROM gacha_records WHERE qq = ? AND gacha_type = ? '
+                                'ORDER BY time DESC LIMIT 1', (qq, gacha_type)).fetchone()
+        return row[0] if row else None
+
+    def load(self, qq, gacha_type, uid=None) -> gacha_columns:
+        uid = self.last_uid(qq, gacha_type) if uid is None else uid
+        cols = gacha_columns(gacha_type, uid or '')
+        if uid is None:
+            return cols
+        rows = self.conn.execute('SELECT id, time, real_type, rank_type, name, item_type FROM gacha_records '
+                                 'WHERE qq = ? AND uid = ? AND gacha_type = ? ORDER BY time, id',
+                                 (qq, uid, gacha_type))
+        for _id, timestamp, real_type, rank_type, name, item_type in rows:
+            cols.add(_id if _id >= FAKE_ID_MAX else 0, timestamp, real_type, rank_type, name, item_type)
+        return cols
+
+    def records(self, qq, cols: gacha_columns, start=0):
+        times = cols.times
+        used = None
+        for index in range(start, len(cols)):
+            _id = cols.ids[index]
+            if not _id:
+                # 已经用掉的假id 有导入的记录才读
+                if used is None:
+                    used = {x for x, in self.conn.execute(
+                        'SELECT id FROM gacha_records WHERE qq = ? AND uid = ? AND gacha_type = ? AND id < ?',
+                        (qq, cols.uid, cols.gacha_type, FAKE_ID_MAX))}
+                _id = fake_id(times[index], 0)
+                while _id in used:
+                    _id += 1
+                used.add(_id)
+            name, item_type = cols.names[cols.items[index]]
+            yield (qq, cols.uid, cols.gacha_type, _id,
+                   times[index], cols.types[index], name, item_type, cols.ranks[index])
+
+    # 从 start 开始的记录写进数据库 已经存在的跳过, 返回新增的条数
+    def insert(self, qq, cols: gacha_columns, start=0):
+        with self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany('INSERT OR IGNORE INTO gacha_records '
+                                  '(qq, uid, gacha_type, id, time, real_type, name, item_type, rank_type) '
+                                  'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', self.records(qq, cols, start))
+            return self.conn.total_changes - before
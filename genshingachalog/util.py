@@ -3,6 +3,8 @@ from sqlitedict import SqliteDict
 from nonebot import *
 import datetime
 import functools
+import asyncio
+import time
 import yaml
 import json
 import os
@@ -92,6 +94,30 @@ def filter_list(plist, func):
     return list(filter(func, plist))
 
 
+# 自适应的请求间隔 同一个key的请求之间至少间隔 interval 秒
+# 请求成功慢慢缩短间隔, 被服务器限制了就加倍
+class rate_limiter:
+    def __init__(self, interval=0.3, min_interval=0.05, max_interval=5):
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.last = {}
+        self.locks = {}
+
+    async def wait(self, key=None):
+        async with self.locks.setdefault(key, asyncio.Lock()):
+            delay = self.last.get(key, 0) + self.interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.last[key] = time.monotonic()
+
+    def success(self):
+        self.interval = max(self.min_interval, self.interval * 0.9)
+
+    def slow_down(self):
+        self.interval = min(self.max_interval, self.interval * 2)
+
+
 def cache(ttl=datetime.timedelta(hours=1)):
     def wrap(func):
         time, value = None, None